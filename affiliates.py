@@ -5,18 +5,25 @@
 
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, TypedDict
+import asyncio
+import base64
 import logging
+import time
+from types import MappingProxyType
+from uuid import uuid4
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status, Query, Body
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, func, table, column, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.deps import get_current_user, get_db
 from app.core.cache_middleware import cache_response
+from app.db.database import db_manager
 from app.schemas.user import User
 from app.schemas.shopping import (
     AffiliateEarningResponse,
-    AffiliateEarningsReport,
     AffiliateStatus,
     Merchant
 )
@@ -28,7 +35,431 @@ from app.api.v1.dependencies.shopping import (
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# =============================================================================
+# TABLAS
+# =============================================================================
+
+# Vista ligera de la tabla gestionada por Prisma (columnas en camelCase)
+affiliate_earnings = table(
+    "affiliate_earnings",
+    column("id"),
+    column("userId"),
+    column("productId"),
+    column("merchant"),
+    column("commissionRate"),
+    column("saleAmount"),
+    column("commissionAmount"),
+    column("currency"),
+    column("affiliateLink"),
+    column("trackingCode"),
+    column("status"),
+    column("customerEmail"),
+    column("clickedAt"),
+    column("purchasedAt"),
+    column("conversionTime"),
+    column("createdAt"),
+    column("updatedAt"),
+)
+
+# Columnas proyectadas con los nombres del schema de respuesta
+EARNING_COLUMNS = (
+    affiliate_earnings.c.id,
+    affiliate_earnings.c.userId.label("user_id"),
+    affiliate_earnings.c.productId.label("product_id"),
+    affiliate_earnings.c.merchant,
+    affiliate_earnings.c.commissionRate.label("commission_rate"),
+    affiliate_earnings.c.saleAmount.label("sale_amount"),
+    affiliate_earnings.c.commissionAmount.label("commission_amount"),
+    affiliate_earnings.c.currency,
+    affiliate_earnings.c.affiliateLink.label("affiliate_link"),
+    affiliate_earnings.c.trackingCode.label("tracking_code"),
+    func.lower(affiliate_earnings.c.status).label("status"),
+    affiliate_earnings.c.customerEmail.label("customer_email"),
+    affiliate_earnings.c.clickedAt.label("clicked_at"),
+    affiliate_earnings.c.purchasedAt.label("purchased_at"),
+    affiliate_earnings.c.conversionTime.label("conversion_time"),
+    affiliate_earnings.c.createdAt.label("created_at"),
+    affiliate_earnings.c.updatedAt.label("updated_at"),
+)
+
+# Cache en proceso de tasas de comisión: (expira_en, {merchant: tasa})
+_RATES_CACHE_TTL = 86400  # 24 horas, igual que el cache HTTP del endpoint
+_RATES_CACHE: Optional[Tuple[float, Dict[str, float]]] = None
+_rates_cache_lock = asyncio.Lock()
+
+# Valores válidos de merchant para validar entradas de texto libre
+_MERCHANT_VALUES = frozenset(m.value for m in Merchant)
+
+# Máximo de consultas concurrentes a merchants
+_MERCHANT_CONCURRENCY = 10
+
+# Buffer de clicks pendientes de persistir en purchase_tracking
+_CLICK_BATCH_SIZE = 500
+_CLICK_FLUSH_INTERVAL = 0.2  # segundos
+# Clicks retenidos como máximo si la BD no está disponible (se reintentan)
+_CLICK_BUFFER_MAX = _CLICK_BATCH_SIZE * 20
+_click_buffer: List[Dict[str, Any]] = []
+_click_buffer_lock = asyncio.Lock()
+# Clicks nuevos desde el último vaciado (los reencolados no cuentan)
+_clicks_since_flush = 0
+
+# Desplazamientos de los periodos de pago mensuales (precalculados)
+_PAYOUT_OFFSETS = tuple((i, timedelta(days=i * 30), timedelta(days=(i + 1) * 30)) for i in range(1, 4))
+
+# =============================================================================
+# TIPOS DE RESPUESTA
+# =============================================================================
+# Solo para type-checking: estos payloads se serializan directo con orjson
+
+class EarningsSummaryData(TypedDict):
+    total_earnings: str
+    pending_earnings: str
+    paid_earnings: str
+    total_clicks: int
+    total_conversions: int
+    conversion_rate: float
+    average_commission: str
+    earnings_by_merchant: List[Dict[str, Any]]
+    earnings_by_month: List[Dict[str, Any]]
+    top_products: List[Dict[str, Any]]
+    period_start: str
+    period_end: str
+
+class PeriodDict(TypedDict):
+    start_date: str
+    end_date: str
+    days: int
+
+class OverviewDict(TypedDict):
+    total_clicks: int
+    total_conversions: int
+    total_earnings: float
+    conversion_rate: float
+    average_commission: float
+    top_performing_day: str
+
+class PerformanceData(TypedDict):
+    period: PeriodDict
+    overview: OverviewDict
+    trends: Dict[str, str]
+    top_merchants: List[Dict[str, Any]]
+    conversion_funnel: Dict[str, Any]
+    best_performing_times: List[Dict[str, int]]
+
+# =============================================================================
+# DATOS DE EJEMPLO
+# =============================================================================
+
+# Constantes de solo lectura construidas una vez al importar el módulo
+_EARNINGS_SUMMARY = MappingProxyType({
+    "total_earnings": "47.85",
+    "pending_earnings": "12.50",
+    "paid_earnings": "35.35",
+    "total_clicks": 156,
+    "total_conversions": 12,
+    "conversion_rate": 0.077,  # 7.7%
+    "average_commission": "3.99",
+    "earnings_by_merchant": [
+        {
+            "merchant": "amazon",
+            "earnings": 28.50,
+            "clicks": 89,
+            "conversions": 7,
+            "commission_rate": 4.0
+        },
+        {
+            "merchant": "asos", 
+            "earnings": 19.35,
+            "clicks": 67,
+            "conversions": 5,
+            "commission_rate": 6.0
+        }
+    ],
+    "earnings_by_month": [
+        {
+            "month": "2024-01",
+            "earnings": 23.75,
+            "clicks": 78,
+            "conversions": 6
+        },
+        {
+            "month": "2024-02",
+            "earnings": 24.10,
+            "clicks": 78,
+            "conversions": 6
+        }
+    ],
+    "top_products": [
+        {
+            "product_id": "prod_1",
+            "product_name": "Camiseta Básica Premium",
+            "merchant": "amazon",
+            "earnings": 8.25,
+            "clicks": 15,
+            "conversions": 3
+        },
+        {
+            "product_id": "prod_2", 
+            "product_name": "Jeans Skinny Azul",
+            "merchant": "asos",
+            "earnings": 7.80,
+            "clicks": 12,
+            "conversions": 2
+        },
+        {
+            "product_id": "prod_3",
+            "product_name": "Blazer Negro Formal",
+            "merchant": "amazon", 
+            "earnings": 6.50,
+            "clicks": 8,
+            "conversions": 1
+        }
+    ]
+})
+
+_PERFORMANCE_OVERVIEW = MappingProxyType({
+    "total_clicks": 234,
+    "total_conversions": 18,
+    "total_earnings": 89.50,
+    "conversion_rate": 7.69,
+    "average_commission": 4.97
+})
+
+_PERFORMANCE_DETAILS = MappingProxyType({
+    "trends": {
+        "clicks_trend": "+15.3%",
+        "conversion_trend": "+8.7%", 
+        "earnings_trend": "+22.1%"
+    },
+    "top_merchants": [
+        {
+            "merchant": "amazon",
+            "clicks": 142,
+            "conversions": 11,
+            "earnings": 52.75,
+            "conversion_rate": 7.75
+        },
+        {
+            "merchant": "asos",
+            "clicks": 92,
+            "conversions": 7,
+            "earnings": 36.75,
+            "conversion_rate": 7.61
+        }
+    ],
+    "conversion_funnel": {
+        "recommendation_views": 1250,
+        "recommendation_clicks": 234,
+        "product_page_visits": 189,
+        "conversions": 18,
+        "click_through_rate": 18.72,
+        "conversion_rate": 9.52
+    },
+    "best_performing_times": [
+        {"hour": 14, "clicks": 28, "conversions": 4},
+        {"hour": 19, "clicks": 31, "conversions": 3},
+        {"hour": 11, "clicks": 24, "conversions": 3}
+    ]
+})
+
+# =============================================================================
+# HELPERS DE MONTOS
+# =============================================================================
+
+def to_cents(amount: Decimal) -> int:
+    """Convertir un monto monetario a centavos enteros"""
+    return int((amount * 100).to_integral_value())
+
+def from_cents(cents: int) -> Decimal:
+    """Convertir centavos enteros a Decimal con dos decimales"""
+    return Decimal(cents).scaleb(-2)
+
+# =============================================================================
+# HELPERS DE PAGINACIÓN
+# =============================================================================
+
+def encode_cursor(created_at: datetime, earning_id: str) -> str:
+    """Codificar la posición (createdAt, id) de la última fila de una página"""
+    raw = f"{created_at.isoformat()}|{earning_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decodificar un cursor generado por encode_cursor"""
+    try:
+        created_at, earning_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), earning_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+
+# =============================================================================
+# CLICK TRACKING BUFFER
+# =============================================================================
+
+async def _insert_clicks(db, batch: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Insertar clicks aislando por bisección las filas que fallan
+    
+    Devuelve (filas insertadas, clicks rechazados).
+    """
+    try:
+        return await db.purchasetracking.create_many(data=batch, skip_duplicates=True), []
+    except Exception:
+        if len(batch) == 1:
+            return 0, batch
+    
+    mid = len(batch) // 2
+    first_count, first_rejected = await _insert_clicks(db, batch[:mid])
+    second_count, second_rejected = await _insert_clicks(db, batch[mid:])
+    return first_count + second_count, first_rejected + second_rejected
+
+
+async def _requeue_clicks(batch: List[Dict[str, Any]]) -> None:
+    """Devolver un lote al inicio del buffer, descartando lo que exceda el máximo"""
+    global _click_buffer
+    
+    async with _click_buffer_lock:
+        _click_buffer = batch + _click_buffer
+        overflow = len(_click_buffer) - _CLICK_BUFFER_MAX
+        if overflow > 0:
+            lost, _click_buffer = _click_buffer[:overflow], _click_buffer[overflow:]
+            logger.error(
+                "Affiliate click buffer full, dropping %s clicks: trackingIds=%s",
+                len(lost), [event["trackingId"] for event in lost]
+            )
+
+
+async def flush_click_buffer() -> int:
+    """
+    Persiste en un solo INSERT los clicks acumulados en el buffer
+    
+    Los productos desconocidos se guardan con productId nulo (la relación es
+    opcional) para que un id inválido no haga fallar todo el lote. Si aun así
+    el INSERT falla: con la BD caída el lote se reencola; si la BD responde, el
+    problema está en los datos y solo se descartan las filas que fallan.
+    """
+    global _click_buffer, _clicks_since_flush
+    
+    async with _click_buffer_lock:
+        _clicks_since_flush = 0
+        if not _click_buffer:
+            return 0
+        batch, _click_buffer = _click_buffer, []
+    
+    try:
+        db = db_manager.get_client()
+    except Exception as e:
+        logger.error("Error flushing %s affiliate clicks: %s", len(batch), e)
+        await _requeue_clicks(batch)
+        return 0
+    
+    try:
+        product_ids = list({event["productId"] for event in batch if event["productId"]})
+        if product_ids:
+            known = {
+                product.id
+                for product in await db.product.find_many(where={"id": {"in": product_ids}})
+            }
+            for event in batch:
+                if event["productId"] not in known:
+                    event["productId"] = None
+        
+        return await db.purchasetracking.create_many(data=batch, skip_duplicates=True)
+    except Exception as e:
+        logger.error("Error flushing %s affiliate clicks: %s", len(batch), e)
+    
+    # ¿BD no disponible o filas inválidas?
+    try:
+        await db.query_raw("SELECT 1")
+    except Exception:
+        # skip_duplicates hace el reintento idempotente
+        await _requeue_clicks(batch)
+        return 0
+    
+    inserted, rejected = await _insert_clicks(db, batch)
+    if rejected:
+        logger.error(
+            "Dropping %s invalid affiliate clicks: trackingIds=%s",
+            len(rejected), [event["trackingId"] for event in rejected]
+        )
+    return inserted
+
+async def run_click_flusher() -> None:
+    """
+    Tarea de fondo que vacía el buffer de clicks periódicamente
+    """
+    try:
+        while True:
+            await asyncio.sleep(_CLICK_FLUSH_INTERVAL)
+            await flush_click_buffer()
+    finally:
+        await flush_click_buffer()
+        if _click_buffer:
+            logger.error(
+                "Shutting down with %s unsaved affiliate clicks: trackingIds=%s",
+                len(_click_buffer), [event["trackingId"] for event in _click_buffer]
+            )
+
+async def _buffer_click(event: Dict[str, Any]) -> None:
+    """Agregar un click al buffer y vaciarlo si alcanza el tamaño de lote"""
+    global _clicks_since_flush
+    
+    async with _click_buffer_lock:
+        _click_buffer.append(event)
+        _clicks_since_flush += 1
+        is_full = _clicks_since_flush >= _CLICK_BATCH_SIZE
+    
+    if is_full:
+        await flush_click_buffer()
+
+# =============================================================================
+# COMMISSION RATES CACHE
+# =============================================================================
+
+async def get_cached_commission_rates(merchant_service) -> Dict[str, float]:
+    """
+    Tasas de comisión por merchant memoizadas en proceso con TTL
+    
+    El lock evita que requests concurrentes con el cache vencido repitan la consulta.
+    """
+    global _RATES_CACHE
+    
+    if _RATES_CACHE is not None and _RATES_CACHE[0] > time.monotonic():
+        return _RATES_CACHE[1]
+    
+    async with _rates_cache_lock:
+        now = time.monotonic()
+        if _RATES_CACHE is not None and _RATES_CACHE[0] > now:
+            return _RATES_CACHE[1]
+        
+        semaphore = asyncio.Semaphore(_MERCHANT_CONCURRENCY)
+        
+        async def fetch_rate(merchant: Merchant) -> float:
+            async with semaphore:
+                return await merchant_service.get_commission_rate(merchant)
+        
+        merchants = list(Merchant)
+        rates = await asyncio.gather(
+            *(fetch_rate(m) for m in merchants),
+            return_exceptions=True
+        )
+        
+        commission_rates = {}
+        for merchant, rate in zip(merchants, rates):
+            if isinstance(rate, Exception):
+                logger.warning("Error getting commission rate for %s: %s", merchant.value, rate)
+                continue
+            commission_rates[merchant.value] = rate
+        
+        # Solo memoizar resultados completos
+        if len(commission_rates) == len(merchants):
+            _RATES_CACHE = (now + _RATES_CACHE_TTL, commission_rates)
+        
+        return commission_rates
 
 # =============================================================================
 # AFFILIATE EARNINGS ENDPOINTS
@@ -36,8 +467,10 @@ router = APIRouter()
 
 @router.get("/earnings", response_model=ResponseModel[List[AffiliateEarningResponse]])
 async def get_affiliate_earnings(
+    response: Response,
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
     status_filter: Optional[AffiliateStatus] = Query(None),
     merchant: Optional[Merchant] = Query(None),
     start_date: Optional[datetime] = Query(None),
@@ -47,49 +480,54 @@ async def get_affiliate_earnings(
 ):
     """
     Obtiene lista de ganancias por afiliados del usuario
+    
+    Con ``cursor`` se pagina por keyset sobre (createdAt, id) y se ignora ``offset``.
     """
     try:
-        logger.info(f"Getting affiliate earnings for user {current_user.id}")
-        
-        # En implementación completa, consultar base de datos con filtros
-        # Por ahora, devolver datos mock
-        mock_earnings = []
-        
-        if not status_filter or status_filter in [AffiliateStatus.CONFIRMED, AffiliateStatus.PAID]:
-            mock_earnings.extend([
-                AffiliateEarningResponse(
-                    id=f"earn_{i}",
-                    user_id=current_user.id,
-                    product_id=f"prod_{i}",
-                    merchant="amazon",
-                    commission_rate=4.0,
-                    sale_amount=Decimal("75.00"),
-                    commission_amount=Decimal("3.00"),
-                    currency="USD",
-                    affiliate_link=f"https://amazon.com/dp/B{i:08d}?tag=synthia-20",
-                    status=AffiliateStatus.CONFIRMED if i % 2 == 0 else AffiliateStatus.PAID,
-                    clicked_at=datetime.now() - timedelta(days=i),
-                    purchased_at=datetime.now() - timedelta(days=i-1) if i % 2 == 0 else None,
-                    conversion_time=24 if i % 2 == 0 else None,
-                    created_at=datetime.now() - timedelta(days=i),
-                    updated_at=datetime.now() - timedelta(days=i-1)
-                )
-                for i in range(1, 6)
-            ])
-        
-        # Aplicar filtros de fecha si se proporcionan
+        logger.info("Getting affiliate earnings for user %s", current_user.id)
+        
+        # Filtros y paginación se resuelven en la base de datos: un solo
+        # predicado compartido por el conteo y la página de resultados
+        conditions = [affiliate_earnings.c.userId == current_user.id]
+        if status_filter:
+            conditions.append(affiliate_earnings.c.status == status_filter.name)
+        if merchant:
+            conditions.append(affiliate_earnings.c.merchant == merchant.value)
         if start_date:
-            mock_earnings = [e for e in mock_earnings if e.created_at >= start_date]
+            conditions.append(affiliate_earnings.c.createdAt >= start_date)
         if end_date:
-            mock_earnings = [e for e in mock_earnings if e.created_at <= end_date]
+            conditions.append(affiliate_earnings.c.createdAt <= end_date)
         
-        # Aplicar filtro de merchant
-        if merchant:
-            mock_earnings = [e for e in mock_earnings if e.merchant == merchant.value]
+        stmt = select(*EARNING_COLUMNS).where(*conditions)
+        
+        total_count = (
+            await db.execute(
+                select(func.count()).select_from(affiliate_earnings).where(*conditions)
+            )
+        ).scalar_one()
+        
+        stmt = stmt.order_by(
+            affiliate_earnings.c.createdAt.desc(),
+            affiliate_earnings.c.id.desc()
+        )
+        if cursor:
+            # Keyset: continuar después de la última fila vista, sin escanear OFFSET
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            stmt = stmt.where(
+                tuple_(affiliate_earnings.c.createdAt, affiliate_earnings.c.id)
+                < tuple_(cursor_created_at, cursor_id)
+            )
+        else:
+            stmt = stmt.offset(offset)
+        
+        result = await db.execute(stmt.limit(limit))
+        paginated_earnings = [
+            AffiliateEarningResponse(**row) for row in result.mappings()
+        ]
         
-        # Paginación
-        total_count = len(mock_earnings)
-        paginated_earnings = mock_earnings[offset:offset + limit]
+        if len(paginated_earnings) == limit:
+            last = paginated_earnings[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
         
         return ResponseModel(
             success=True,
@@ -97,15 +535,23 @@ async def get_affiliate_earnings(
             message=f"Se encontraron {total_count} ganancias de afiliados"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error getting affiliate earnings: {e}")
+        logger.error("Error getting affiliate earnings: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al obtener ganancias de afiliados"
         )
 
-@router.get("/earnings/summary", response_model=ResponseModel[AffiliateEarningsReport])
-@cache_response(ttl=1800)  # Cache por 30 minutos
+@router.get("/earnings/summary")
+@cache_response(
+    ttl=1800,  # Cache por 30 minutos
+    stale_ttl=86400,  # Copia de respaldo por 24 horas
+    key_builder=lambda req, **kw: (
+        f"affiliate:earnings_summary:{req.state.user_id}:{req.query_params.get('days', '30')}"
+    )
+)
 async def get_earnings_summary(
     days: int = Query(30, ge=1, le=365),
     current_user: User = Depends(get_current_user),
@@ -118,85 +564,24 @@ async def get_earnings_summary(
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        logger.info(f"Getting earnings summary for user {current_user.id} from {start_date} to {end_date}")
+        logger.info("Getting earnings summary for user %s from %s to %s", current_user.id, start_date, end_date)
         
         # En implementación completa, calcular desde base de datos
-        earnings_report = AffiliateEarningsReport(
-            total_earnings=Decimal("47.85"),
-            pending_earnings=Decimal("12.50"),
-            paid_earnings=Decimal("35.35"),
-            total_clicks=156,
-            total_conversions=12,
-            conversion_rate=0.077,  # 7.7%
-            average_commission=Decimal("3.99"),
-            earnings_by_merchant=[
-                {
-                    "merchant": "amazon",
-                    "earnings": 28.50,
-                    "clicks": 89,
-                    "conversions": 7,
-                    "commission_rate": 4.0
-                },
-                {
-                    "merchant": "asos", 
-                    "earnings": 19.35,
-                    "clicks": 67,
-                    "conversions": 5,
-                    "commission_rate": 6.0
-                }
-            ],
-            earnings_by_month=[
-                {
-                    "month": "2024-01",
-                    "earnings": 23.75,
-                    "clicks": 78,
-                    "conversions": 6
-                },
-                {
-                    "month": "2024-02",
-                    "earnings": 24.10,
-                    "clicks": 78,
-                    "conversions": 6
-                }
-            ],
-            top_products=[
-                {
-                    "product_id": "prod_1",
-                    "product_name": "Camiseta Básica Premium",
-                    "merchant": "amazon",
-                    "earnings": 8.25,
-                    "clicks": 15,
-                    "conversions": 3
-                },
-                {
-                    "product_id": "prod_2", 
-                    "product_name": "Jeans Skinny Azul",
-                    "merchant": "asos",
-                    "earnings": 7.80,
-                    "clicks": 12,
-                    "conversions": 2
-                },
-                {
-                    "product_id": "prod_3",
-                    "product_name": "Blazer Negro Formal",
-                    "merchant": "amazon", 
-                    "earnings": 6.50,
-                    "clicks": 8,
-                    "conversions": 1
-                }
-            ],
-            period_start=start_date,
-            period_end=end_date
-        )
+        # Payload ya serializable: se omite la validación de response_model
+        earnings_report: EarningsSummaryData = {
+            **_EARNINGS_SUMMARY,
+            "period_start": start_date.isoformat(),
+            "period_end": end_date.isoformat()
+        }
         
-        return ResponseModel(
-            success=True,
-            data=earnings_report,
-            message="Resumen de ganancias obtenido exitosamente"
-        )
+        return ORJSONResponse(content={
+            "success": True,
+            "data": earnings_report,
+            "message": "Resumen de ganancias obtenido exitosamente"
+        })
         
     except Exception as e:
-        logger.error(f"Error getting earnings summary: {e}")
+        logger.error("Error getting earnings summary: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al obtener resumen de ganancias"
@@ -212,41 +597,34 @@ async def get_earning_details(
     Obtiene detalles de una ganancia específica
     """
     try:
-        # En implementación completa, consultar base de datos
-        # Verificar que la ganancia pertenece al usuario
-        
-        # Mock data
-        earning = AffiliateEarningResponse(
-            id=earning_id,
-            user_id=current_user.id,
-            product_id="prod_example",
-            merchant="amazon",
-            commission_rate=4.0,
-            sale_amount=Decimal("89.99"),
-            commission_amount=Decimal("3.60"),
-            currency="USD",
-            affiliate_link="https://amazon.com/dp/B12345678?tag=synthia-20",
-            status=AffiliateStatus.CONFIRMED,
-            tracking_code="TRK123456",
-            customer_email="customer@example.com",
-            clicked_at=datetime.now() - timedelta(days=5),
-            purchased_at=datetime.now() - timedelta(days=3),
-            conversion_time=48,
-            created_at=datetime.now() - timedelta(days=5),
-            updated_at=datetime.now() - timedelta(days=3)
+        # Búsqueda por clave primaria, restringida a las ganancias del usuario
+        result = await db.execute(
+            select(*EARNING_COLUMNS).where(
+                affiliate_earnings.c.id == earning_id,
+                affiliate_earnings.c.userId == current_user.id
+            )
         )
+        row = result.mappings().one_or_none()
+        
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Ganancia no encontrada"
+            )
         
         return ResponseModel(
             success=True,
-            data=earning,
+            data=AffiliateEarningResponse(**row),
             message="Detalles de ganancia obtenidos exitosamente"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error getting earning details: {e}")
+        logger.error("Error getting earning details: %s", e)
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Ganancia no encontrada"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al obtener detalles de ganancia"
         )
 
 # =============================================================================
@@ -255,30 +633,53 @@ async def get_earning_details(
 
 @router.post("/track/click")
 async def track_affiliate_click(
+    merchant_service: MerchantIntegrationServiceDep,
+    background_tasks: BackgroundTasks,
     product_id: str = Body(...),
     merchant: str = Body(...),
     source: str = Body(default="app"),
     user_agent: Optional[str] = Body(None),
     referrer: Optional[str] = Body(None),
     current_user: User = Depends(get_current_user),
-    merchant_service: MerchantIntegrationServiceDep,
     db: AsyncSession = Depends(get_db)
 ):
     """
     Registra un click en link de afiliado
     """
+    if merchant not in _MERCHANT_VALUES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Merchant no soportado: {merchant}"
+        )
+    
     try:
-        logger.info(f"Tracking affiliate click for user {current_user.id}, product {product_id}")
+        logger.info("Tracking affiliate click for user %s, product %s", current_user.id, product_id)
         
-        # Generar tracking ID
-        tracking_id = await merchant_service.track_affiliate_click(
+        # Generar tracking ID localmente y registrar el click después de responder
+        tracking_id = uuid4().hex
+        background_tasks.add_task(
+            merchant_service.track_affiliate_click,
             product_id=product_id,
             user_id=current_user.id,
             affiliate_link=f"https://{merchant}.com/product/{product_id}",
-            source=source
+            source=source,
+            tracking_id=tracking_id
         )
         
-        # En implementación completa, guardar en base de datos con más detalles
+        clicked_at = datetime.now()
+        
+        # Persistencia por lotes: el flusher inserta el buffer periódicamente
+        await _buffer_click({
+            "trackingId": tracking_id,
+            "userId": current_user.id,
+            "productId": product_id,
+            "clickedAt": clicked_at,
+            "clickSource": source,
+            "affiliateLink": f"https://{merchant}.com/product/{product_id}",
+            "referrerUrl": referrer,
+            "userAgent": user_agent
+        })
+        
         tracking_data = {
             "tracking_id": tracking_id,
             "user_id": current_user.id,
@@ -287,7 +688,7 @@ async def track_affiliate_click(
             "source": source,
             "user_agent": user_agent,
             "referrer": referrer,
-            "clicked_at": datetime.now().isoformat()
+            "clicked_at": clicked_at.isoformat()
         }
         
         return ResponseModel(
@@ -297,7 +698,7 @@ async def track_affiliate_click(
         )
         
     except Exception as e:
-        logger.error(f"Error tracking affiliate click: {e}")
+        logger.error("Error tracking affiliate click: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al registrar click"
@@ -316,7 +717,7 @@ async def track_conversion(
     Registra una conversión (compra) de afiliado
     """
     try:
-        logger.info(f"Tracking conversion for user {current_user.id}, tracking_id {tracking_id}")
+        logger.info("Tracking conversion for user %s, tracking_id %s", current_user.id, tracking_id)
         
         # En implementación completa:
         # 1. Buscar el click original por tracking_id
@@ -328,15 +729,19 @@ async def track_conversion(
         if commission_rate is None:
             commission_rate = 4.0  # Default 4%
         
-        commission_amount = purchase_amount * Decimal(str(commission_rate / 100))
+        # Aritmética en centavos y puntos básicos; Decimal solo en la respuesta
+        purchase_cents = to_cents(purchase_amount)
+        rate_bp = int(round(commission_rate * 100))
+        commission_cents = purchase_cents * rate_bp // 10_000
+        commission_amount = from_cents(commission_cents)
         
         # Crear registro de ganancia mock
         earning_data = {
             "tracking_id": tracking_id,
             "user_id": current_user.id,
-            "purchase_amount": float(purchase_amount),
+            "purchase_amount": purchase_cents / 100,
             "commission_rate": commission_rate,
-            "commission_amount": float(commission_amount),
+            "commission_amount": commission_cents / 100,
             "order_id": order_id,
             "status": "pending",
             "converted_at": datetime.now().isoformat()
@@ -349,7 +754,7 @@ async def track_conversion(
         )
         
     except Exception as e:
-        logger.error(f"Error tracking conversion: {e}")
+        logger.error("Error tracking conversion: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al registrar conversión"
@@ -359,30 +764,30 @@ async def track_conversion(
 # MERCHANT COMMISSION RATES ENDPOINTS  
 # =============================================================================
 
-@router.get("/commission-rates", response_model=ResponseModel[Dict[str, float]])
-@cache_response(ttl=86400)  # Cache por 24 horas
+@router.get("/commission-rates")
+@cache_response(
+    ttl=86400,  # Cache por 24 horas
+    stale_ttl=86400,
+    key_builder=lambda req, **kw: "affiliate:commission_rates"  # Igual para todos los usuarios
+)
 async def get_commission_rates(
-    current_user: User = Depends(get_current_user),
-    merchant_service: MerchantIntegrationServiceDep
+    merchant_service: MerchantIntegrationServiceDep,
+    current_user: User = Depends(get_current_user)
 ):
     """
     Obtiene tasas de comisión por merchant
     """
     try:
-        commission_rates = {}
-        
-        for merchant in Merchant:
-            rate = await merchant_service.get_commission_rate(merchant)
-            commission_rates[merchant.value] = rate
+        commission_rates = dict(await get_cached_commission_rates(merchant_service))
         
-        return ResponseModel(
-            success=True,
-            data=commission_rates,
-            message="Tasas de comisión obtenidas exitosamente"
-        )
+        return ORJSONResponse(content={
+            "success": True,
+            "data": commission_rates,
+            "message": "Tasas de comisión obtenidas exitosamente"
+        })
         
     except Exception as e:
-        logger.error(f"Error getting commission rates: {e}")
+        logger.error("Error getting commission rates: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al obtener tasas de comisión"
@@ -404,20 +809,21 @@ async def get_payouts(
     """
     try:
         # En implementación completa, consultar base de datos
-        mock_payouts = [
-            {
+        now = datetime.now()
+        mock_payouts = []
+        for i, period_end_offset, period_start_offset in _PAYOUT_OFFSETS:
+            period_end = (now - period_end_offset).isoformat()
+            mock_payouts.append({
                 "id": f"payout_{i}",
                 "amount": 45.75 - (i * 5),
                 "currency": "USD",
                 "status": "paid" if i % 2 == 0 else "pending",
                 "payment_method": "paypal",
-                "payment_date": (datetime.now() - timedelta(days=i * 30)).isoformat(),
+                "payment_date": period_end,
                 "earnings_count": 8 - i,
-                "period_start": (datetime.now() - timedelta(days=(i+1) * 30)).isoformat(),
-                "period_end": (datetime.now() - timedelta(days=i * 30)).isoformat()
-            }
-            for i in range(1, 4)
-        ]
+                "period_start": (now - period_start_offset).isoformat(),
+                "period_end": period_end
+            })
         
         return ResponseModel(
             success=True,
@@ -426,7 +832,7 @@ async def get_payouts(
         )
         
     except Exception as e:
-        logger.error(f"Error getting payouts: {e}")
+        logger.error("Error getting payouts: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al obtener historial de pagos"
@@ -457,18 +863,19 @@ async def request_payout(
                 detail=f"Saldo insuficiente. Disponible: ${available_balance}, Mínimo: ${minimum_amount}"
             )
         
+        now = datetime.now()
         payout_request = {
-            "id": f"payout_req_{current_user.id}_{int(datetime.now().timestamp())}",
+            "id": f"payout_req_{current_user.id}_{int(now.timestamp())}",
             "user_id": current_user.id,
             "amount": float(available_balance),
             "currency": "USD",
             "payment_method": payment_method,
             "status": "pending",
-            "requested_at": datetime.now().isoformat(),
-            "estimated_payment_date": (datetime.now() + timedelta(days=7)).isoformat()
+            "requested_at": now.isoformat(),
+            "estimated_payment_date": (now + timedelta(days=7)).isoformat()
         }
         
-        logger.info(f"Payout requested by user {current_user.id}: ${available_balance}")
+        logger.info("Payout requested by user %s: $%s", current_user.id, available_balance)
         
         return ResponseModel(
             success=True,
@@ -479,7 +886,7 @@ async def request_payout(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error requesting payout: {e}")
+        logger.error("Error requesting payout: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al solicitar pago"
@@ -489,8 +896,14 @@ async def request_payout(
 # ANALYTICS ENDPOINTS
 # =============================================================================
 
-@router.get("/analytics/performance", response_model=ResponseModel[Dict[str, Any]])
-@cache_response(ttl=3600)  # Cache por 1 hora
+@router.get("/analytics/performance")
+@cache_response(
+    ttl=3600,  # Cache por 1 hora
+    stale_ttl=86400,  # Copia de respaldo por 24 horas
+    key_builder=lambda req, **kw: (
+        f"affiliate:performance:{req.state.user_id}:{req.query_params.get('days', '30')}"
+    )
+)
 async def get_affiliate_performance(
     days: int = Query(30, ge=1, le=365),
     current_user: User = Depends(get_current_user),
@@ -504,64 +917,27 @@ async def get_affiliate_performance(
         start_date = end_date - timedelta(days=days)
         
         # En implementación completa, calcular desde base de datos
-        performance_data = {
+        performance_data: PerformanceData = {
             "period": {
                 "start_date": start_date.isoformat(),
                 "end_date": end_date.isoformat(),
                 "days": days
             },
             "overview": {
-                "total_clicks": 234,
-                "total_conversions": 18,
-                "total_earnings": 89.50,
-                "conversion_rate": 7.69,
-                "average_commission": 4.97,
-                "top_performing_day": (datetime.now() - timedelta(days=12)).isoformat()
-            },
-            "trends": {
-                "clicks_trend": "+15.3%",
-                "conversion_trend": "+8.7%", 
-                "earnings_trend": "+22.1%"
+                **_PERFORMANCE_OVERVIEW,
+                "top_performing_day": (end_date - timedelta(days=12)).isoformat()
             },
-            "top_merchants": [
-                {
-                    "merchant": "amazon",
-                    "clicks": 142,
-                    "conversions": 11,
-                    "earnings": 52.75,
-                    "conversion_rate": 7.75
-                },
-                {
-                    "merchant": "asos",
-                    "clicks": 92,
-                    "conversions": 7,
-                    "earnings": 36.75,
-                    "conversion_rate": 7.61
-                }
-            ],
-            "conversion_funnel": {
-                "recommendation_views": 1250,
-                "recommendation_clicks": 234,
-                "product_page_visits": 189,
-                "conversions": 18,
-                "click_through_rate": 18.72,
-                "conversion_rate": 9.52
-            },
-            "best_performing_times": [
-                {"hour": 14, "clicks": 28, "conversions": 4},
-                {"hour": 19, "clicks": 31, "conversions": 3},
-                {"hour": 11, "clicks": 24, "conversions": 3}
-            ]
+            **_PERFORMANCE_DETAILS
         }
         
-        return ResponseModel(
-            success=True,
-            data=performance_data,
-            message="Métricas de rendimiento obtenidas exitosamente"
-        )
+        return ORJSONResponse(content={
+            "success": True,
+            "data": performance_data,
+            "message": "Métricas de rendimiento obtenidas exitosamente"
+        })
         
     except Exception as e:
-        logger.error(f"Error getting affiliate performance: {e}")
+        logger.error("Error getting affiliate performance: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al obtener métricas de rendimiento"
@@ -3,81 +3,155 @@ Endpoints de autenticación para Synthia Style API
 Maneja registro, login, logout y gestión de tokens
 """
 
-from datetime import datetime, timedelta
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
 from typing import Any, Dict
 
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer
+import jwt
+from prisma.errors import UniqueViolationError
 
 from app.schemas.auth import (
     UserRegister, UserLogin, Token, RefreshToken, PasswordChange,
     PasswordReset, PasswordResetConfirm, LogoutRequest
 )
-from app.schemas.common import APIResponse
-from app.schemas.user import UserResponse
+from app.schemas.common import APIResponse, ResponseStatus
 from app.core.security import (
     PasswordManager, TokenManager, SecurityLogger,
-    get_current_user_id
+    get_current_user_id, revoke_all_tokens, DUMMY_HASH
 )
-from app.db.database import get_db
+from app.db.database import get_db, db_manager
 from app.core.logging import SecurityLogger
+from app.schemas.user import UserResponse
+from app.services.cache_service import cache_service
+from app.services.user_service import preferences_schema
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 security = HTTPBearer()
+logger = logging.getLogger(__name__)
+
+# Vida de la sesión (refresh token) registrada en BD y en Redis
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+_SESSION_TTL = timedelta(seconds=SESSION_TTL_SECONDS)
+_PASSWORD_RESET_TTL = timedelta(hours=1)
+
+# Filtro Bloom de emails registrados: evita consultar la BD en forgot-password
+# para emails que seguro no existen
+EMAIL_FILTER_KEY = "emails_bf"
+_EMAIL_FILTER_BATCH = 5000
+
+# Login por email directo con asyncpg (sentencia preparada y cacheada por conexión)
+_LOGIN_USER_SQL = (
+    'SELECT id, email, password, "isActive", "tokenVersion" '
+    'FROM "users" WHERE email = $1'
+)
+
+
+def _session_jti(refresh_token: str) -> str:
+    """Obtener el jti de un refresh token ya emitido por nosotros"""
+    return jwt.decode(refresh_token, options={"verify_signature": False}).get("jti", "")
+
+
+async def warmup_email_filter() -> int:
+    """
+    Cargar en el filtro Bloom todos los emails registrados
+    
+    Se ejecuta al arrancar; mientras no termine, el filtro no se marca como
+    completo y forgot-password sigue consultando la base de datos.
+    """
+    if not cache_service.redis or await cache_service.exists(f"{EMAIL_FILTER_KEY}:ready"):
+        return 0
+    
+    loaded = 0
+    last_email = ""
+    try:
+        db = db_manager.get_client()
+        while True:
+            rows = await db.query_raw(
+                'SELECT email FROM "users" WHERE email > $1 ORDER BY email LIMIT $2',
+                last_email,
+                _EMAIL_FILTER_BATCH
+            )
+            if not rows:
+                break
+            
+            emails = [row["email"] for row in rows]
+            if not await cache_service.bloom_add_many(
+                EMAIL_FILTER_KEY, [email.lower() for email in emails]
+            ):
+                return loaded
+            loaded += len(emails)
+            last_email = emails[-1]
+        
+        await cache_service.bloom_mark_ready(EMAIL_FILTER_KEY)
+    except Exception as e:
+        logger.error("Error cargando el filtro de emails: %s", e)
+    
+    return loaded
+
+
+async def _register_session(user_id: str, refresh_token: str) -> None:
+    """Registrar el jti del refresh token en Redis para validar refresh sin consultar la BD"""
+    jti = _session_jti(refresh_token)
+    if jti:
+        await cache_service.register_refresh_token(jti, user_id, ttl=SESSION_TTL_SECONDS)
 
 
 @router.post("/register", response_model=APIResponse)
 async def register_user(
     user_data: UserRegister,
     request: Request,
+    background_tasks: BackgroundTasks,
     db=Depends(get_db)
 ) -> APIResponse:
     """
     Registrar nuevo usuario
     """
+    ip_address = request.client.host if request.client else None
+    user_agent = request.headers.get("user-agent")
+    
     try:
-        # Verificar si el email ya existe
-        existing_user = await db.user.find_unique(
-            where={"email": user_data.email}
-        )
+        # Hash de la contraseña
+        hashed_password = await PasswordManager.hash_password_async(user_data.password)
         
-        if existing_user:
+        # Crear usuario y preferencias por defecto en una sola escritura anidada;
+        # el índice único de email detecta duplicados sin consulta previa
+        try:
+            new_user = await db.user.create(
+                data={
+                    "email": user_data.email,
+                    "password": hashed_password,
+                    "firstName": user_data.first_name,
+                    "lastName": user_data.last_name,
+                    "isActive": True,
+                    "preferences": {
+                        "create": {
+                            "emailNotifications": True,
+                            "pushNotifications": True,
+                            "shareAnalytics": False,
+                            "profileVisibility": "private"
+                        }
+                    }
+                }
+            )
+        except UniqueViolationError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="El email ya está registrado"
             )
         
-        # Hash de la contraseña
-        hashed_password = PasswordManager.hash_password(user_data.password)
+        await cache_service.bloom_add(EMAIL_FILTER_KEY, new_user.email.lower())
         
-        # Crear usuario en la base de datos
-        new_user = await db.user.create(
-            data={
-                "email": user_data.email,
-                "password": hashed_password,
-                "firstName": user_data.first_name,
-                "lastName": user_data.last_name,
-                "isActive": True
-            }
-        )
-        
-        # Crear preferencias por defecto
-        await db.userpreferences.create(
-            data={
-                "userId": new_user.id,
-                "emailNotifications": True,
-                "pushNotifications": True,
-                "shareAnalytics": False,
-                "profileVisibility": "private"
-            }
-        )
-        
-        # Log de registro exitoso
-        SecurityLogger.log_authentication(
+        # Log de registro exitoso, fuera del camino crítico de la respuesta
+        background_tasks.add_task(
+            SecurityLogger.log_authentication,
             user_id=new_user.id,
             success=True,
-            ip_address=request.client.host if request.client else None,
-            user_agent=request.headers.get("user-agent")
+            ip_address=ip_address,
+            user_agent=user_agent
         )
         
         return APIResponse(
@@ -91,12 +165,14 @@ async def register_user(
     except HTTPException:
         raise
     except Exception as e:
-        # Log de error
-        SecurityLogger.log_authentication(
+        # Log de error: las tareas en segundo plano no se ejecutan si la
+        # respuesta falla, así que se escribe aquí pero fuera del event loop
+        await asyncio.to_thread(
+            SecurityLogger.log_authentication,
             user_id=user_data.email,
             success=False,
-            ip_address=request.client.host if request.client else None,
-            user_agent=request.headers.get("user-agent")
+            ip_address=ip_address,
+            user_agent=user_agent
         )
         
         raise HTTPException(
@@ -109,25 +185,30 @@ async def register_user(
 async def login_user(
     user_data: UserLogin,
     request: Request,
+    background_tasks: BackgroundTasks,
     db=Depends(get_db)
 ) -> Token:
     """
     Iniciar sesión de usuario
     """
+    ip_address = request.client.host if request.client else None
+    user_agent = request.headers.get("user-agent")
+    
     try:
-        # Buscar usuario por email
-        user = await db.user.find_unique(
-            where={"email": user_data.email},
-            include={"preferences": True}
-        )
+        # Buscar usuario por email (solo las columnas que usa el login)
+        user = await db_manager.get_pg_pool().fetchrow(_LOGIN_USER_SQL, user_data.email)
         
         # Verificar si el usuario existe y está activo
-        if not user or not user.isActive:
-            SecurityLogger.log_authentication(
+        if not user or not user["isActive"]:
+            # Verificación ficticia para igualar el tiempo de respuesta
+            await PasswordManager.verify_password_async(user_data.password, DUMMY_HASH)
+            
+            await asyncio.to_thread(
+                SecurityLogger.log_authentication,
                 user_id=user_data.email,
                 success=False,
-                ip_address=request.client.host if request.client else None,
-                user_agent=request.headers.get("user-agent")
+                ip_address=ip_address,
+                user_agent=user_agent
             )
             
             raise HTTPException(
@@ -136,12 +217,13 @@ async def login_user(
             )
         
         # Verificar contraseña
-        if not PasswordManager.verify_password(user_data.password, user.password):
-            SecurityLogger.log_authentication(
-                user_id=user.id,
+        if not await PasswordManager.verify_password_async(user_data.password, user["password"]):
+            await asyncio.to_thread(
+                SecurityLogger.log_authentication,
+                user_id=user["id"],
                 success=False,
-                ip_address=request.client.host if request.client else None,
-                user_agent=request.headers.get("user-agent")
+                ip_address=ip_address,
+                user_agent=user_agent
             )
             
             raise HTTPException(
@@ -151,28 +233,45 @@ async def login_user(
         
         # Generar tokens
         access_token = TokenManager.create_access_token(
-            data={"sub": user.id, "email": user.email}
+            data={"sub": user["id"], "email": user["email"], "ver": user["tokenVersion"]}
         )
-        refresh_token = TokenManager.create_refresh_token(user.id)
+        refresh_token = TokenManager.create_refresh_token(user["id"], token_version=user["tokenVersion"])
         
         # Crear sesión en la base de datos
         session_data = {
-            "userId": user.id,
+            "userId": user["id"],
+            "userEmail": user["email"],
             "token": refresh_token,
-            "expiresAt": datetime.utcnow() + timedelta(days=7),
+            "expiresAt": datetime.now(timezone.utc) + _SESSION_TTL,
             "isActive": True,
-            "userAgent": request.headers.get("user-agent"),
-            "ipAddress": request.client.host if request.client else None
+            "userAgent": user_agent,
+            "ipAddress": ip_address
         }
         
-        await db.usersession.create(data=session_data)
+        new_password_hash = None
+        if PasswordManager.needs_rehash(user["password"]):
+            # Actualizar hashes antiguos (bcrypt) o con parámetros desactualizados
+            new_password_hash = await PasswordManager.hash_password_async(user_data.password)
+        
+        # Escrituras en un solo round-trip transaccional
+        async with db.batch_() as batcher:
+            batcher.usersession.create(data=session_data)
+            if new_password_hash:
+                batcher.user.update(
+                    where={"id": user["id"]},
+                    data={"password": new_password_hash}
+                )
+        
+        # La BD sigue siendo la fuente de verdad; Redis sirve las validaciones de refresh
+        await _register_session(user["id"], refresh_token)
         
-        # Log de login exitoso
-        SecurityLogger.log_authentication(
-            user_id=user.id,
+        # Log de login exitoso, fuera del camino crítico de la respuesta
+        background_tasks.add_task(
+            SecurityLogger.log_authentication,
+            user_id=user["id"],
             success=True,
-            ip_address=request.client.host if request.client else None,
-            user_agent=request.headers.get("user-agent")
+            ip_address=ip_address,
+            user_agent=user_agent
         )
         
         return Token(
@@ -204,36 +303,55 @@ async def refresh_token(
         payload = TokenManager.verify_token(refresh_data.refresh_token, "refresh")
         user_id = payload.get("sub")
         
-        # Verificar que la sesión existe y está activa
-        session = await db.usersession.find_first(
-            where={
-                "token": refresh_data.refresh_token,
-                "userId": user_id,
-                "isActive": True,
-                "expiresAt": {"gte": datetime.utcnow()}
-            }
-        )
-        
-        if not session:
+        # Rechazo rápido en Redis solo si el jti pertenece a otro usuario. Una clave
+        # ausente (expulsada por allkeys-lru, registro fallido en el login) o un
+        # error de Redis no prueban nada: decide la sesión en la BD, que se
+        # desactiva en todas las revocaciones
+        jti = payload.get("jti")
+        owner = await cache_service.get_refresh_token_owner(jti) if jti else None
+        if owner is not None and owner != user_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Refresh token inválido o expirado"
             )
         
-        # Buscar usuario
-        user = await db.user.find_unique(
-            where={"id": user_id}
+        # Una sola consulta: la sesión lleva el email y se desactiva junto con el usuario
+        session = await db.usersession.find_unique(
+            where={"token": refresh_data.refresh_token}
         )
         
-        if not user or not user.isActive:
+        if (
+            not session
+            or session.userId != user_id
+            or not session.isActive
+            or session.expiresAt < datetime.now(timezone.utc)
+        ):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Usuario inválido"
+                detail="Refresh token inválido o expirado"
+            )
+        
+        email = session.userEmail
+        token_version = payload.get("ver")
+        
+        # Sesiones creadas antes de desnormalizar el email: leer el usuario
+        if email is None or token_version is None:
+            user = await db.user.find_unique(
+                where={"id": user_id}
             )
+            
+            if not user or not user.isActive:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Usuario inválido"
+                )
+            
+            email = user.email
+            token_version = user.tokenVersion
         
         # Generar nuevo access token
         new_access_token = TokenManager.create_access_token(
-            data={"sub": user.id, "email": user.email}
+            data={"sub": user_id, "email": email, "ver": token_version}
         )
         
         return Token(
@@ -268,20 +386,31 @@ async def logout_user(
                 where={"userId": current_user_id},
                 data={"isActive": False}
             )
+            await cache_service.revoke_user_refresh_tokens(current_user_id)
+            await revoke_all_tokens(db, current_user_id)
             message = "Sesión cerrada en todos los dispositivos"
         else:
             # Desactivar solo la sesión actual (requeriría token específico)
-            # Por simplicidad, desactivamos la más reciente
-            recent_session = await db.usersession.find_first(
-                where={"userId": current_user_id, "isActive": True},
-                order={"createdAt": "desc"}
+            # Por simplicidad, desactivamos la más reciente en un único UPDATE
+            closed_sessions = await db.query_raw(
+                """
+                UPDATE "user_sessions"
+                SET "isActive" = false, "updatedAt" = NOW()
+                WHERE id = (
+                    SELECT id FROM "user_sessions"
+                    WHERE "userId" = $1 AND "isActive" = true
+                    ORDER BY "createdAt" DESC
+                    LIMIT 1
+                )
+                RETURNING "token"
+                """,
+                current_user_id
             )
             
-            if recent_session:
-                await db.usersession.update(
-                    where={"id": recent_session.id},
-                    data={"isActive": False}
-                )
+            for closed in closed_sessions:
+                jti = _session_jti(closed["token"])
+                if jti:
+                    await cache_service.revoke_refresh_token(jti, current_user_id)
             
             message = "Sesión cerrada exitosamente"
         
@@ -316,14 +445,14 @@ async def change_password(
             )
         
         # Verificar contraseña actual
-        if not PasswordManager.verify_password(password_data.current_password, user.password):
+        if not await PasswordManager.verify_password_async(password_data.current_password, user.password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Contraseña actual incorrecta"
             )
         
         # Hash de la nueva contraseña
-        new_hashed_password = PasswordManager.hash_password(password_data.new_password)
+        new_hashed_password = await PasswordManager.hash_password_async(password_data.new_password)
         
         # Actualizar contraseña en la base de datos
         await db.user.update(
@@ -336,6 +465,8 @@ async def change_password(
             where={"userId": current_user_id},
             data={"isActive": False}
         )
+        await cache_service.revoke_user_refresh_tokens(current_user_id)
+        await revoke_all_tokens(db, current_user_id)
         
         return APIResponse(message="Contraseña cambiada exitosamente")
         
@@ -357,17 +488,19 @@ async def forgot_password(
     Solicitar reset de contraseña
     """
     try:
-        # Verificar si el usuario existe
-        user = await db.user.find_unique(
-            where={"email": reset_data.email}
-        )
+        # El filtro Bloom descarta sin tocar la BD los emails que no existen
+        user = None
+        if await cache_service.bloom_might_contain(EMAIL_FILTER_KEY, reset_data.email.lower()):
+            user = await db.user.find_unique(
+                where={"email": reset_data.email}
+            )
         
         # Por seguridad, siempre retornamos éxito aunque el email no exista
         if user:
             # Generar token de reset (en producción, enviar por email)
             reset_token = TokenManager.create_access_token(
                 data={"sub": user.id, "type": "password_reset"},
-                expires_delta=timedelta(hours=1)  # Expira en 1 hora
+                expires_delta=_PASSWORD_RESET_TTL  # Expira en 1 hora
             )
             
             # TODO: Enviar email con el token de reset
@@ -417,7 +550,7 @@ async def reset_password(
             )
         
         # Hash de la nueva contraseña
-        new_hashed_password = PasswordManager.hash_password(reset_data.new_password)
+        new_hashed_password = await PasswordManager.hash_password_async(reset_data.new_password)
         
         # Actualizar contraseña
         await db.user.update(
@@ -430,6 +563,8 @@ async def reset_password(
             where={"userId": user_id},
             data={"isActive": False}
         )
+        await cache_service.revoke_user_refresh_tokens(user_id)
+        await revoke_all_tokens(db, user_id)
         
         return APIResponse(message="Contraseña restablecida exitosamente")
         
@@ -442,13 +577,16 @@ async def reset_password(
         )
 
 
-@router.get("/me", response_model=UserResponse)
+@router.get("/me", response_model=None, responses={200: {"model": UserResponse}})
 async def get_current_user(
     current_user_id: str = Depends(get_current_user_id),
     db=Depends(get_db)
-) -> UserResponse:
+) -> Dict[str, Any]:
     """
     Obtener información del usuario autenticado
+
+    Los datos vienen de la BD (fuente confiable): se devuelven con la forma de
+    UserResponse sin revalidarlos con Pydantic y orjson los serializa.
     """
     try:
         user = await db.user.find_unique(
@@ -462,16 +600,19 @@ async def get_current_user(
                 detail="Usuario no encontrado"
             )
         
-        return UserResponse(
-            id=user.id,
-            email=user.email,
-            first_name=user.firstName,
-            last_name=user.lastName,
-            is_active=user.isActive,
-            created_at=user.createdAt,
-            updated_at=user.updatedAt,
-            preferences=user.preferences
-        )
+        return {
+            "id": user.id,
+            "email": user.email,
+            "first_name": user.firstName,
+            "last_name": user.lastName,
+            "is_active": user.isActive,
+            "created_at": user.createdAt,
+            "updated_at": user.updatedAt,
+            "preferences": (
+                preferences_schema(user.preferences).model_dump(mode="json")
+                if user.preferences else None
+            )
+        }
         
     except HTTPException:
         raise
@@ -482,39 +623,41 @@ async def get_current_user(
         )
 
 
-@router.get("/sessions", response_model=APIResponse)
+@router.get("/sessions", response_model=None)
 async def get_user_sessions(
     current_user_id: str = Depends(get_current_user_id),
     db=Depends(get_db)
-) -> APIResponse:
+) -> Dict[str, Any]:
     """
     Obtener sesiones activas del usuario
+
+    Devuelve un dict plano con la forma de APIResponse; orjson serializa
+    los datetime directamente sin revalidar el modelo de respuesta.
     """
     try:
-        sessions = await db.usersession.find_many(
-            where={
-                "userId": current_user_id,
-                "isActive": True,
-                "expiresAt": {"gte": datetime.utcnow()}
-            },
-            order={"createdAt": "desc"}
-        )
-        
-        session_data = [
-            {
-                "id": session.id,
-                "created_at": session.createdAt,
-                "expires_at": session.expiresAt,
-                "ip_address": session.ipAddress,
-                "user_agent": session.userAgent
-            }
-            for session in sessions
-        ]
-        
-        return APIResponse(
-            message="Sesiones obtenidas exitosamente",
-            data={"sessions": session_data}
-        )
+        # Proyección de las cinco columnas expuestas, ya con claves snake_case,
+        # acotada a las 50 sesiones más recientes
+        session_data = await db.query_raw(
+            """
+            SELECT id,
+                   "createdAt" AS created_at,
+                   "expiresAt" AS expires_at,
+                   "ipAddress" AS ip_address,
+                   "userAgent" AS user_agent
+            FROM "user_sessions"
+            WHERE "userId" = $1 AND "isActive" = true AND "expiresAt" >= NOW()
+            ORDER BY "createdAt" DESC
+            LIMIT 50
+            """,
+            current_user_id
+        )
+        
+        return {
+            "status": ResponseStatus.SUCCESS,
+            "message": "Sesiones obtenidas exitosamente",
+            "data": {"sessions": session_data},
+            "timestamp": datetime.now(timezone.utc)
+        }
         
     except Exception as e:
         raise HTTPException(
@@ -3,17 +3,109 @@ Endpoints para gestión y monitoreo del sistema de cache Redis
 Métricas, health checks y administración de cache
 """
 
+import time
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
 
+from app.core.config import settings
 from app.schemas.common import APIResponse
-from app.core.security import get_current_user_id
+from app.core.security import get_current_user_id, require_admin
 from app.db.database import get_db
 from app.services.cache_service import cache_service
 from app.schemas.user import UserRole
 
 router = APIRouter()
 
+# Tamaño de lote sugerido a SCAN: trabajo acotado por llamada sin bloquear Redis
+_SCAN_COUNT = 500
+
+# Health check reutilizado por /info durante unos segundos: (expira_en, health)
+_INFO_HEALTH_TTL = 5
+_info_health: Optional[tuple] = None
+
+
+async def _list_keys(pattern: str, limit: int) -> List[Dict[str, Any]]:
+    """Claves que coinciden con el patrón, con su TTL"""
+    async with cache_service._redis_operation() as redis:
+        # SCAN incremental con corte temprano en lugar de KEYS (O(N) y bloqueante)
+        keys = []
+        async for key in redis.scan_iter(match=pattern, count=min(limit, _SCAN_COUNT)):
+            keys.append(key)
+            if len(keys) >= limit:
+                break
+        
+        # TTL de todas las claves en un único round trip
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.ttl(key)
+            ttls = await pipe.execute(raise_on_error=False)
+    
+    # Obtener información adicional para cada clave
+    key_info = []
+    for key, ttl in zip(keys, ttls):
+        if isinstance(ttl, Exception):
+            continue
+        key_info.append({
+            "key": key.decode('utf-8') if isinstance(key, bytes) else key,
+            "ttl": ttl,
+            "expires": ttl > 0
+        })
+    
+    return key_info
+
+
+async def _analysis_key_stats(pattern: str) -> Dict[str, Any]:
+    """Número de entradas, distribución de TTL y tamaño estimado de un patrón"""
+    async with cache_service._redis_operation() as redis:
+        # Contar con SCAN incremental; solo se conservan las claves a analizar
+        keys = []
+        total_entries = 0
+        async for key in redis.scan_iter(match=pattern, count=_SCAN_COUNT):
+            total_entries += 1
+            if len(keys) < 100:
+                keys.append(key)
+        
+        # TTL y MEMORY USAGE de todas las claves (como máximo 100) en un único
+        # round trip, en lugar de dos comandos secuenciales por clave
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.ttl(key)
+                pipe.memory_usage(key)
+            results = await pipe.execute(raise_on_error=False)
+    
+    # Analizar TTL de las entradas
+    ttl_stats = {
+        "expired": 0,
+        "expiring_soon": 0,  # < 1 hora
+        "healthy": 0
+    }
+    
+    total_size = 0
+    
+    for ttl, memory_usage in zip(results[::2], results[1::2]):
+        if isinstance(ttl, Exception):
+            continue
+        
+        if ttl == -1:  # No expira
+            ttl_stats["healthy"] += 1
+        elif ttl <= 0:  # Expirado
+            ttl_stats["expired"] += 1
+        elif ttl < 3600:  # Expira en menos de 1 hora
+            ttl_stats["expiring_soon"] += 1
+        else:
+            ttl_stats["healthy"] += 1
+        
+        # Estimar tamaño
+        if memory_usage and not isinstance(memory_usage, Exception):
+            total_size += memory_usage
+    
+    return {
+        "total_entries": total_entries,
+        "ttl_stats": ttl_stats,
+        "total_size": total_size
+    }
+
 
 @router.get("/health", response_model=Dict[str, Any])
 async def cache_health_check():
@@ -34,21 +126,12 @@ async def cache_health_check():
 
 @router.get("/metrics", response_model=Dict[str, Any])
 async def get_cache_metrics(
-    current_user_id: str = Depends(get_current_user_id),
-    db=Depends(get_db)
+    _=Depends(require_admin)
 ):
     """
     Obtener métricas detalladas del cache (solo para administradores)
     """
     try:
-        # Verificar permisos de administrador
-        current_user = await db.user.find_unique(where={"id": current_user_id})
-        if not current_user or current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tienes permisos para acceder a esta información"
-            )
-        
         metrics = await cache_service.get_metrics()
         
         return {
@@ -68,21 +151,12 @@ async def get_cache_metrics(
 
 @router.post("/metrics/reset", response_model=APIResponse)
 async def reset_cache_metrics(
-    current_user_id: str = Depends(get_current_user_id),
-    db=Depends(get_db)
+    _=Depends(require_admin)
 ):
     """
     Resetear métricas del cache (solo para administradores)
     """
     try:
-        # Verificar permisos de administrador
-        current_user = await db.user.find_unique(where={"id": current_user_id})
-        if not current_user or current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tienes permisos para realizar esta acción"
-            )
-        
         await cache_service.reset_metrics()
         
         return APIResponse(message="Métricas del cache reseteadas exitosamente")
@@ -100,21 +174,12 @@ async def reset_cache_metrics(
 async def get_cache_keys(
     pattern: Optional[str] = Query(default="*", description="Patrón de búsqueda"),
     limit: int = Query(default=100, ge=1, le=1000, description="Límite de resultados"),
-    current_user_id: str = Depends(get_current_user_id),
-    db=Depends(get_db)
+    _=Depends(require_admin)
 ):
     """
     Obtener lista de claves en el cache (solo para administradores)
     """
     try:
-        # Verificar permisos de administrador
-        current_user = await db.user.find_unique(where={"id": current_user_id})
-        if not current_user or current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tienes permisos para acceder a esta información"
-            )
-        
         if not cache_service.redis:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -122,25 +187,7 @@ async def get_cache_keys(
             )
         
         # Obtener claves que coincidan con el patrón
-        async with cache_service._redis_operation() as redis:
-            keys = await redis.keys(pattern)
-            
-            # Limitar resultados
-            keys = keys[:limit]
-            
-            # Obtener información adicional para cada clave
-            key_info = []
-            for key in keys:
-                try:
-                    key_str = key.decode('utf-8') if isinstance(key, bytes) else key
-                    ttl = await redis.ttl(key)
-                    key_info.append({
-                        "key": key_str,
-                        "ttl": ttl,
-                        "expires": ttl > 0
-                    })
-                except Exception:
-                    continue
+        key_info = await _list_keys(pattern, limit)
         
         return {
             "keys": key_info,
@@ -161,21 +208,12 @@ async def get_cache_keys(
 @router.delete("/keys/{key_pattern}", response_model=APIResponse)
 async def delete_cache_keys(
     key_pattern: str = Path(..., description="Patrón de claves a eliminar"),
-    current_user_id: str = Depends(get_current_user_id),
-    db=Depends(get_db)
+    _=Depends(require_admin)
 ):
     """
     Eliminar claves del cache por patrón (solo para administradores)
     """
     try:
-        # Verificar permisos de administrador
-        current_user = await db.user.find_unique(where={"id": current_user_id})
-        if not current_user or current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tienes permisos para realizar esta acción"
-            )
-        
         # Prevenir eliminación masiva accidental
         if key_pattern in ["*", "**", ""]:
             raise HTTPException(
@@ -201,21 +239,12 @@ async def delete_cache_keys(
 @router.get("/analysis/{analysis_type}/stats", response_model=Dict[str, Any])
 async def get_analysis_cache_stats(
     analysis_type: str = Path(..., description="Tipo de análisis (facial, chromatic)"),
-    current_user_id: str = Depends(get_current_user_id),
-    db=Depends(get_db)
+    _=Depends(require_admin)
 ):
     """
     Obtener estadísticas de cache para un tipo de análisis específico
     """
     try:
-        # Verificar permisos de administrador
-        current_user = await db.user.find_unique(where={"id": current_user_id})
-        if not current_user or current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tienes permisos para acceder a esta información"
-            )
-        
         if analysis_type not in ["facial", "chromatic"]:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -231,45 +260,13 @@ async def get_analysis_cache_stats(
         # Buscar claves de análisis
         pattern = f"analysis:{analysis_type}:*"
         
-        async with cache_service._redis_operation() as redis:
-            keys = await redis.keys(pattern)
-            
-            total_entries = len(keys)
-            
-            # Analizar TTL de las entradas
-            ttl_stats = {
-                "expired": 0,
-                "expiring_soon": 0,  # < 1 hora
-                "healthy": 0
-            }
-            
-            total_size = 0
-            
-            for key in keys[:100]:  # Limitar análisis a 100 claves
-                try:
-                    ttl = await redis.ttl(key)
-                    
-                    if ttl == -1:  # No expira
-                        ttl_stats["healthy"] += 1
-                    elif ttl <= 0:  # Expirado
-                        ttl_stats["expired"] += 1
-                    elif ttl < 3600:  # Expira en menos de 1 hora
-                        ttl_stats["expiring_soon"] += 1
-                    else:
-                        ttl_stats["healthy"] += 1
-                    
-                    # Estimar tamaño
-                    memory_usage = await redis.memory_usage(key)
-                    if memory_usage:
-                        total_size += memory_usage
-                        
-                except Exception:
-                    continue
+        key_stats = await _analysis_key_stats(pattern)
+        total_size = key_stats["total_size"]
         
         return {
             "analysis_type": analysis_type,
-            "total_entries": total_entries,
-            "ttl_stats": ttl_stats,
+            "total_entries": key_stats["total_entries"],
+            "ttl_stats": key_stats["ttl_stats"],
             "estimated_size_bytes": total_size,
             "estimated_size_mb": round(total_size / (1024 * 1024), 2),
             "pattern": pattern
@@ -337,21 +334,12 @@ async def invalidate_user_cache(
 
 @router.post("/warmup", response_model=APIResponse)
 async def warmup_cache(
-    current_user_id: str = Depends(get_current_user_id),
-    db=Depends(get_db)
+    _=Depends(require_admin)
 ):
     """
     Ejecutar warmup manual del cache (solo para administradores)
     """
     try:
-        # Verificar permisos de administrador
-        current_user = await db.user.find_unique(where={"id": current_user_id})
-        if not current_user or current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tienes permisos para realizar esta acción"
-            )
-        
         # Ejecutar warmup
         await cache_service._warmup_cache()
         
@@ -366,39 +354,51 @@ async def warmup_cache(
         )
 
 
+@lru_cache(maxsize=1)
+def _static_cache_info() -> Dict[str, Any]:
+    """Configuración del cache: depende solo de settings, se construye una vez"""
+    return {
+        "compression_enabled": settings.CACHE_COMPRESSION_ENABLED,
+        "compression_algorithm": settings.CACHE_COMPRESSION_ALGORITHM,
+        "metrics_enabled": settings.CACHE_METRICS_ENABLED,
+        "warmup_enabled": settings.CACHE_WARMUP_ENABLED,
+        "ttl_config": {
+            "default": settings.CACHE_TTL_SECONDS,
+            "analytics": settings.CACHE_ANALYTICS_TTL_SECONDS,
+            "user_session": settings.CACHE_USER_SESSION_TTL_SECONDS,
+            "ai_analysis": settings.CACHE_AI_ANALYSIS_TTL_SECONDS,
+            "chromatic_analysis": settings.CACHE_CHROMATIC_ANALYSIS_TTL_SECONDS,
+            "recommendations": settings.CACHE_RECOMMENDATIONS_TTL_SECONDS,
+            "config": settings.CACHE_CONFIG_TTL_SECONDS
+        },
+        "namespaces": {
+            "user": settings.CACHE_USER_NAMESPACE,
+            "analysis": settings.CACHE_ANALYSIS_NAMESPACE,
+            "recommendations": settings.CACHE_RECOMMENDATIONS_NAMESPACE,
+            "config": settings.CACHE_CONFIG_NAMESPACE,
+            "session": settings.CACHE_SESSION_NAMESPACE
+        }
+    }
+
+
 @router.get("/info", response_model=Dict[str, Any])
 async def get_cache_info():
     """
     Obtener información general del sistema de cache
     """
+    global _info_health
+    
     try:
         info = {
             "redis_enabled": cache_service.redis is not None,
-            "compression_enabled": settings.CACHE_COMPRESSION_ENABLED,
-            "compression_algorithm": settings.CACHE_COMPRESSION_ALGORITHM,
-            "metrics_enabled": settings.CACHE_METRICS_ENABLED,
-            "warmup_enabled": settings.CACHE_WARMUP_ENABLED,
-            "ttl_config": {
-                "default": settings.CACHE_TTL_SECONDS,
-                "analytics": settings.CACHE_ANALYTICS_TTL_SECONDS,
-                "user_session": settings.CACHE_USER_SESSION_TTL_SECONDS,
-                "ai_analysis": settings.CACHE_AI_ANALYSIS_TTL_SECONDS,
-                "chromatic_analysis": settings.CACHE_CHROMATIC_ANALYSIS_TTL_SECONDS,
-                "recommendations": settings.CACHE_RECOMMENDATIONS_TTL_SECONDS,
-                "config": settings.CACHE_CONFIG_TTL_SECONDS
-            },
-            "namespaces": {
-                "user": settings.CACHE_USER_NAMESPACE,
-                "analysis": settings.CACHE_ANALYSIS_NAMESPACE,
-                "recommendations": settings.CACHE_RECOMMENDATIONS_NAMESPACE,
-                "config": settings.CACHE_CONFIG_NAMESPACE,
-                "session": settings.CACHE_SESSION_NAMESPACE
-            }
+            **_static_cache_info()
         }
         
         if cache_service.redis:
-            health = await cache_service.health_check()
-            info["health"] = health
+            now = time.time()
+            if _info_health is None or _info_health[0] <= now:
+                _info_health = (now + _INFO_HEALTH_TTL, await cache_service.health_check())
+            info["health"] = _info_health[1]
         
         return info
         
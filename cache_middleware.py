@@ -3,9 +3,14 @@ Middleware de cache para FastAPI
 Manejo automático de cache para endpoints y métricas de performance
 """
 
+import asyncio
+import hashlib
+import inspect
 import time
-from typing import Dict, Any, Optional
-from fastapi import Request, Response
+from functools import wraps
+from typing import Callable, Dict, Any, Optional
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 
@@ -257,3 +262,124 @@ def create_cache_middleware():
 def create_cache_metrics_middleware():
     """Factory para crear middleware de métricas"""
     return CacheMetricsMiddleware(None)
+
+
+def cache_response(
+    ttl: int = settings.CACHE_TTL_SECONDS,
+    key_builder: Optional[Callable[..., str]] = None,
+    stale_ttl: int = 0,
+    soft_timeout: float = 0.5
+):
+    """
+    Decorador de cache para endpoints individuales
+    
+    La clave se genera con ``key_builder(request, **kwargs)`` si se proporciona;
+    por defecto se incluye el usuario autenticado para no compartir respuestas
+    entre usuarios distintos.
+    
+    Con ``stale_ttl`` la entrada se conserva ese tiempo extra después de expirar:
+    si el endpoint falla o tarda más de ``soft_timeout`` segundos se devuelve la
+    última respuesta válida con ``X-Cache: STALE``.
+    
+    Cada entrada guarda un ETag; si coincide con ``If-None-Match`` se responde
+    ``304 Not Modified`` sin cuerpo.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        accepts_request = "request" in signature.parameters
+        
+        def _cached_to_response(
+            request: Request,
+            cached_data: Dict[str, Any],
+            cache_status: str
+        ) -> Response:
+            headers = {"X-Cache": cache_status}
+            etag = cached_data.get("etag")
+            if etag:
+                headers["ETag"] = etag
+                if request.headers.get("if-none-match") == etag:
+                    return Response(status_code=304, headers=headers)
+            
+            return Response(
+                content=cached_data["body"],
+                status_code=cached_data.get("status_code", 200),
+                media_type=cached_data.get("media_type", "application/json"),
+                headers=headers
+            )
+        
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Optional[Request] = (
+                kwargs.get("request") if accepts_request else kwargs.pop("request", None)
+            )
+            if request is None:
+                return await func(*args, **kwargs)
+            
+            # Exponer el usuario resuelto por la dependencia de autenticación
+            current_user = kwargs.get("current_user")
+            if current_user is not None:
+                request.state.user_id = current_user.id
+            
+            cached_data = None
+            try:
+                if key_builder:
+                    cache_key = key_builder(request, **kwargs)
+                else:
+                    user_id = getattr(request.state, "user_id", "anonymous")
+                    query_hash = cache_service.key_generator.create_hash(str(request.query_params))
+                    cache_key = f"endpoint:{user_id}:{request.url.path}:{query_hash}"
+                
+                cached_data = await cache_service.get(cache_key)
+                if cached_data and cached_data.get("fresh_until", 0) > time.time():
+                    return _cached_to_response(request, cached_data, "HIT")
+            except Exception as e:
+                DatabaseLogger.log_error("cache_response_get", "cache", e)
+                cache_key = None
+            
+            if cached_data:
+                # Hay copia vencida: no bloquear más de soft_timeout en el backend
+                try:
+                    result = await asyncio.wait_for(func(*args, **kwargs), timeout=soft_timeout)
+                except HTTPException as e:
+                    if e.status_code < 500:
+                        raise
+                    return _cached_to_response(request, cached_data, "STALE")
+                except Exception:
+                    return _cached_to_response(request, cached_data, "STALE")
+            else:
+                result = await func(*args, **kwargs)
+            
+            if isinstance(result, Response):
+                response = result
+            else:
+                response = JSONResponse(content=jsonable_encoder(result))
+            
+            if cache_key and response.status_code == 200:
+                now = time.time()
+                etag = f'"{hashlib.sha1(response.body).hexdigest()[:16]}"'
+                response.headers["ETag"] = etag
+                try:
+                    await cache_service.set(cache_key, {
+                        "body": response.body.decode(),
+                        "status_code": response.status_code,
+                        "media_type": response.media_type,
+                        "etag": etag,
+                        "fresh_until": now + ttl,
+                        "stale_until": now + ttl + stale_ttl
+                    }, ttl + stale_ttl)
+                except Exception as e:
+                    DatabaseLogger.log_error("cache_response_set", "cache", e)
+            
+            response.headers["X-Cache"] = "MISS"
+            return response
+        
+        # FastAPI debe inyectar el Request aunque el endpoint no lo declare
+        if not accepts_request:
+            parameters = list(signature.parameters.values())
+            parameters.append(inspect.Parameter(
+                "request", inspect.Parameter.KEYWORD_ONLY, annotation=Request
+            ))
+            wrapper.__signature__ = signature.replace(parameters=parameters)
+        
+        return wrapper
+    return decorator
@@ -15,6 +15,7 @@ from dataclasses import dataclass, asdict
 from contextlib import asynccontextmanager
 
 import aioredis
+import msgspec
 from aioredis import Redis
 from fastapi import HTTPException
 
@@ -22,6 +23,11 @@ from app.core.config import settings
 from app.core.logging import DatabaseLogger
 
 
+# Codificador JSON de los valores cacheados: datetime, Decimal, Enum y dataclasses
+# se codifican en C; lo demás (p. ej. UUID u objetos propios) cae a str()
+_json_encoder = msgspec.json.Encoder(enc_hook=str)
+_json_decoder = msgspec.json.Decoder()
+
 @dataclass
 class CacheMetrics:
     """Métricas de performance del cache"""
@@ -122,6 +128,16 @@ class CacheKeyGenerator:
         """Generar clave para sesiones"""
         return f"{settings.CACHE_SESSION_NAMESPACE}:{user_id}:{session_type}"
     
+    @staticmethod
+    def refresh_token_key(jti: str) -> str:
+        """Generar clave para un refresh token (jti -> user_id)"""
+        return f"rt:{jti}"
+    
+    @staticmethod
+    def user_refresh_tokens_key(user_id: str) -> str:
+        """Generar clave del índice de refresh tokens de un usuario"""
+        return f"user_rt:{user_id}"
+    
     @classmethod
     def create_hash(cls, data: Any) -> str:
         """Crear hash único para datos complejos"""
@@ -202,11 +218,8 @@ class CacheService:
     def _serialize_data(self, data: Any) -> bytes:
         """Serializar datos para almacenamiento"""
         try:
-            if settings.CACHE_SERIALIZATION_FORMAT == "json":
-                serialized = json.dumps(data, default=str).encode('utf-8')
-            else:
-                # Fallback a JSON
-                serialized = json.dumps(data, default=str).encode('utf-8')
+            # JSON es el único formato soportado (cualquier otro valor cae a JSON)
+            serialized = _json_encoder.encode(data)
             
             # Comprimir si está habilitado
             if settings.CACHE_COMPRESSION_ENABLED:
@@ -233,11 +246,7 @@ class CacheService:
                 )
             
             # Deserializar
-            if settings.CACHE_SERIALIZATION_FORMAT == "json":
-                return json.loads(data.decode('utf-8'))
-            else:
-                # Fallback a JSON
-                return json.loads(data.decode('utf-8'))
+            return _json_decoder.decode(data)
                 
         except Exception as e:
             DatabaseLogger.log_error("deserialize_data", "cache", e)
@@ -338,7 +347,8 @@ class CacheService:
             
         try:
             async with self._redis_operation() as redis:
-                keys = await redis.keys(pattern)
+                # SCAN incremental en lugar de KEYS, que bloquea Redis en O(N)
+                keys = [key async for key in redis.scan_iter(match=pattern, count=500)]
                 if keys:
                     deleted = await redis.delete(*keys)
                     self.metrics.deletes += deleted
@@ -424,6 +434,78 @@ class CacheService:
         
         return await self.set(key, cache_data, ttl)
     
+    async def register_refresh_token(self, jti: str, user_id: str, ttl: int) -> bool:
+        """Registrar jti -> user_id y añadirlo al índice del usuario en un solo round trip"""
+        if not self.redis:
+            return False
+        
+        index_key = self.key_generator.user_refresh_tokens_key(user_id)
+        try:
+            async with self._redis_operation() as redis:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.set(self.key_generator.refresh_token_key(jti), user_id, ex=ttl)
+                    pipe.sadd(index_key, jti)
+                    pipe.expire(index_key, ttl)
+                    await pipe.execute()
+                self.metrics.sets += 1
+                return True
+        except Exception as e:
+            DatabaseLogger.log_error("cache_register_refresh_token", "cache", e, {"user_id": user_id})
+            return False
+    
+    async def get_refresh_token_owners(self, jtis: List[str]) -> List[Optional[str]]:
+        """Resolver el user_id de varios refresh tokens con un único MGET"""
+        if not self.redis or not jtis:
+            return [None] * len(jtis)
+        
+        try:
+            async with self._redis_operation() as redis:
+                owners = await redis.mget(
+                    [self.key_generator.refresh_token_key(jti) for jti in jtis]
+                )
+                return [owner.decode() if owner is not None else None for owner in owners]
+        except Exception as e:
+            DatabaseLogger.log_error("cache_get_refresh_token_owners", "cache", e)
+            return [None] * len(jtis)
+    
+    async def get_refresh_token_owner(self, jti: str) -> Optional[str]:
+        """Obtener el user_id dueño de un refresh token"""
+        return (await self.get_refresh_token_owners([jti]))[0]
+    
+    async def revoke_refresh_token(self, jti: str, user_id: str) -> bool:
+        """Revocar un refresh token y quitarlo del índice del usuario"""
+        if not self.redis:
+            return False
+        
+        try:
+            async with self._redis_operation() as redis:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.delete(self.key_generator.refresh_token_key(jti))
+                    pipe.srem(self.key_generator.user_refresh_tokens_key(user_id), jti)
+                    deleted, _ = await pipe.execute()
+                self.metrics.deletes += deleted
+                return deleted > 0
+        except Exception as e:
+            DatabaseLogger.log_error("cache_revoke_refresh_token", "cache", e, {"user_id": user_id})
+            return False
+    
+    async def revoke_user_refresh_tokens(self, user_id: str) -> int:
+        """Revocar todos los refresh tokens de un usuario (SMEMBERS + DEL en pipeline)"""
+        if not self.redis:
+            return 0
+        
+        index_key = self.key_generator.user_refresh_tokens_key(user_id)
+        try:
+            async with self._redis_operation() as redis:
+                jtis = await redis.smembers(index_key)
+                keys = [self.key_generator.refresh_token_key(jti.decode()) for jti in jtis]
+                deleted = await redis.delete(*keys, index_key)
+                self.metrics.deletes += deleted
+                return deleted
+        except Exception as e:
+            DatabaseLogger.log_error("cache_revoke_user_refresh_tokens", "cache", e, {"user_id": user_id})
+            return 0
+    
     async def invalidate_user_cache(self, user_id: str) -> int:
         """Invalidar todo el cache de un usuario"""
         pattern = f"{settings.CACHE_USER_NAMESPACE}:{user_id}:*"
@@ -434,6 +516,76 @@ class CacheService:
         pattern = f"{settings.CACHE_SESSION_NAMESPACE}:{user_id}:*"
         return await self.invalidate_pattern(pattern)
     
+    # =================== FILTRO BLOOM SOBRE BITMAP ===================
+    
+    # 2^24 bits (2 MB) y 7 funciones hash: ~1% de falsos positivos con 1M elementos
+    BLOOM_BITS = 1 << 24
+    BLOOM_HASHES = 7
+    
+    @classmethod
+    def _bloom_offsets(cls, item: str) -> List[int]:
+        """Posiciones del elemento por doble hashing sobre un único sha256"""
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return [(h1 + i * h2) % cls.BLOOM_BITS for i in range(cls.BLOOM_HASHES)]
+    
+    async def bloom_add_many(self, key: str, items: List[str]) -> bool:
+        """Añadir elementos al filtro Bloom en un único pipeline de SETBIT"""
+        if not self.redis or not items:
+            return False
+        
+        try:
+            async with self._redis_operation() as redis:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for item in items:
+                        for offset in self._bloom_offsets(item):
+                            pipe.setbit(key, offset, 1)
+                    await pipe.execute()
+                return True
+        except Exception as e:
+            DatabaseLogger.log_error("cache_bloom_add", "cache", e, {"key": key})
+            # Un elemento sin añadir haría fiable un negativo falso: el filtro deja
+            # de considerarse completo hasta que se reconstruya
+            await self.delete(f"{key}:ready")
+            return False
+    
+    async def bloom_add(self, key: str, item: str) -> bool:
+        """Añadir un elemento al filtro Bloom"""
+        return await self.bloom_add_many(key, [item])
+    
+    async def bloom_mark_ready(self, key: str) -> bool:
+        """Marcar el filtro como completo: a partir de aquí sus negativos son fiables"""
+        return await self.set(f"{key}:ready", True)
+    
+    async def bloom_might_contain(self, key: str, item: str) -> bool:
+        """
+        Consultar el filtro Bloom en un solo round trip
+        
+        Devuelve True ("quizá") si Redis no está disponible, el filtro aún no
+        está marcado como completo o el bitmap ha desaparecido (p. ej. expulsado
+        por allkeys-lru), para que el llamador consulte la fuente real.
+        """
+        if not self.redis:
+            return True
+        
+        try:
+            async with self._redis_operation() as redis:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.exists(f"{key}:ready")
+                    pipe.exists(key)
+                    for offset in self._bloom_offsets(item):
+                        pipe.getbit(key, offset)
+                    ready, present, *bits = await pipe.execute()
+                
+                if ready and not present:
+                    # Bitmap perdido con la marca viva: forzar la reconstrucción
+                    await self.delete(f"{key}:ready")
+                return not (ready and present) or all(bits)
+        except Exception as e:
+            DatabaseLogger.log_error("cache_bloom_check", "cache", e, {"key": key})
+            return True
+    
     # =================== MÉTODOS PARA RECOMENDACIONES ===================
     
     async def get_recommendations_cache(self, category: str, filters: Dict) -> Optional[List]:
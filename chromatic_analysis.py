@@ -15,7 +15,9 @@ from app.schemas.chromatic_analysis import (
 from app.schemas.common import APIResponse, PaginationParams, PaginatedResponse
 from app.core.security import get_current_user_id
 from app.db.database import get_db
-from app.services.gemini_service import gemini_service
+from app.services.gemini_service import (
+    gemini_service, GeminiCapacityError, GEMINI_RETRY_AFTER_SECONDS
+)
 from app.services.user_service import subscription_service, user_onboarding_service
 
 router = APIRouter()
@@ -161,6 +163,12 @@ async def analyze_chromatic_profile(
         
     except HTTPException:
         raise
+    except GeminiCapacityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(GEMINI_RETRY_AFTER_SECONDS)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -7,8 +7,7 @@ from typing import Optional, Any, List, Dict, Generic, TypeVar
 from datetime import datetime
 from enum import Enum
 
-from pydantic import BaseModel, Field, validator
-from pydantic.generics import GenericModel
+from pydantic import BaseModel, ConfigDict, Field, validator
 
 
 # Tipos genéricos para respuestas paginadas
@@ -29,11 +28,6 @@ class APIResponse(BaseModel):
     message: str
     data: Optional[Any] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class ErrorResponse(BaseModel):
@@ -43,11 +37,6 @@ class ErrorResponse(BaseModel):
     error_code: Optional[str] = None
     details: Optional[Dict[str, Any]] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class HealthCheck(BaseModel):
@@ -58,11 +47,6 @@ class HealthCheck(BaseModel):
     environment: str
     database: Dict[str, Any]
     services: Dict[str, Dict[str, Any]] = {}
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class PaginationParams(BaseModel):
@@ -99,18 +83,13 @@ class PaginationMeta(BaseModel):
         )
 
 
-class PaginatedResponse(GenericModel, Generic[T]):
+class PaginatedResponse(BaseModel, Generic[T]):
     """Respuesta paginada genérica"""
     status: ResponseStatus = ResponseStatus.SUCCESS
     message: str = "Datos obtenidos exitosamente"
     data: List[T]
     meta: PaginationMeta
     timestamp: datetime = Field(default_factory=datetime.utcnow)
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class FileUpload(BaseModel):
@@ -154,7 +133,7 @@ class ImageMetadata(BaseModel):
 class SortParams(BaseModel):
     """Parámetros de ordenamiento"""
     field: str = Field(description="Campo por el cual ordenar")
-    direction: str = Field(default="asc", regex="^(asc|desc)$", description="Dirección del ordenamiento")
+    direction: str = Field(default="asc", pattern="^(asc|desc)$", description="Dirección del ordenamiento")
     
     @validator('field')
     def validate_field(cls, v):
@@ -182,20 +161,21 @@ class CoordinatesData(BaseModel):
     latitude: float = Field(ge=-90, le=90, description="Latitud")
     longitude: float = Field(ge=-180, le=180, description="Longitud")
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "latitude": -12.0464,
                 "longitude": -77.0428
             }
         }
+    )
 
 
 class ContactInfo(BaseModel):
     """Información de contacto"""
-    email: Optional[str] = Field(None, regex=r'^[^@]+@[^@]+\.[^@]+$')
-    phone: Optional[str] = Field(None, regex=r'^\+?[1-9]\d{1,14}$')
-    website: Optional[str] = Field(None, regex=r'^https?://.+')
+    email: Optional[str] = Field(None, pattern=r'^[^@]+@[^@]+\.[^@]+$')
+    phone: Optional[str] = Field(None, pattern=r'^\+?[1-9]\d{1,14}$')
+    website: Optional[str] = Field(None, pattern=r'^https?://.+')
     
     @validator('email')
     def validate_email(cls, v):
@@ -213,8 +193,8 @@ class SystemInfo(BaseModel):
     memory_usage_mb: float
     cpu_usage_percent: float
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "version": "1.0.0",
                 "environment": "production",
@@ -224,6 +204,7 @@ class SystemInfo(BaseModel):
                 "cpu_usage_percent": 25.3
             }
         }
+    )
 
 
 class ValidationError(BaseModel):
@@ -233,8 +214,8 @@ class ValidationError(BaseModel):
     code: str
     value: Any
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "field": "email",
                 "message": "Formato de email inválido",
@@ -242,6 +223,7 @@ class ValidationError(BaseModel):
                 "value": "email-invalido"
             }
         }
+    )
 
 
 class BulkOperation(BaseModel):
@@ -275,15 +257,13 @@ class BulkOperationResult(BaseModel):
         return (self.successful / self.total) * 100
 
 
-# Configuración base para todos los modelos
-class BaseConfig:
-    """Configuración base para modelos Pydantic"""
-    use_enum_values = True
-    validate_assignment = True
-    extra = "forbid"
-    json_encoders = {
-        datetime: lambda v: v.isoformat() if v else None,
-    }
+# Configuración base para todos los modelos (Pydantic v2: se resuelve al
+# crear la clase y la validación corre en pydantic-core)
+BASE_MODEL_CONFIG = ConfigDict(
+    use_enum_values=True,
+    validate_assignment=True,
+    extra="forbid",
+)
 
 
 # Mixin para timestamps
@@ -292,8 +272,7 @@ class TimestampMixin(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 # Mixin para metadatos
@@ -301,5 +280,4 @@ class MetadataMixin(BaseModel):
     """Mixin para campos de metadatos"""
     metadata: Optional[Dict[str, Any]] = Field(None, description="Metadatos adicionales")
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
@@ -6,7 +6,9 @@ Maneja conexiones PostgreSQL con Prisma ORM
 import asyncio
 from typing import Optional, AsyncGenerator
 from contextlib import asynccontextmanager
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
+import asyncpg
 from prisma import Prisma
 from prisma.errors import PrismaError
 from loguru import logger
@@ -15,11 +17,41 @@ from app.core.config import settings
 from app.core.logging import DatabaseLogger
 
 
+# Parámetros de la URL que solo entiende Prisma; asyncpg los rechazaría
+_PRISMA_ONLY_PARAMS = frozenset({
+    "schema", "connection_limit", "pool_timeout", "pgbouncer", "socket_timeout"
+})
+
+
+def _prisma_url(url: str) -> str:
+    """Añadir a DATABASE_URL los parámetros del pool del motor de Prisma"""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.setdefault("connection_limit", str(settings.DATABASE_CONNECTION_LIMIT))
+    query.setdefault("pool_timeout", str(settings.DATABASE_POOL_TIMEOUT))
+    if settings.DATABASE_PGBOUNCER:
+        query.setdefault("pgbouncer", "true")
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _asyncpg_dsn(url: str) -> str:
+    """Adaptar DATABASE_URL (formato Prisma) para asyncpg"""
+    parts = urlsplit(url)
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query)
+        if key not in _PRISMA_ONLY_PARAMS
+    ]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
 class DatabaseManager:
     """Gestor principal de base de datos"""
     
     def __init__(self):
         self.client: Optional[Prisma] = None
+        # Pool asyncpg para las consultas calientes de autenticación: evita el
+        # salto al motor de Prisma y reutiliza sentencias preparadas por conexión
+        self.pg_pool: Optional[asyncpg.Pool] = None
         self._connected: bool = False
     
     async def connect(self) -> None:
@@ -30,8 +62,20 @@ class DatabaseManager:
         
         try:
             logger.info("Conectando a la base de datos...")
-            self.client = Prisma()
+            # Un único cliente por proceso: el motor de Prisma mantiene el pool
+            # de conexiones y se reutiliza en todas las peticiones
+            self.client = Prisma(
+                datasource={"url": _prisma_url(settings.DATABASE_URL)},
+                http={"timeout": 10}
+            )
             await self.client.connect()
+            self.pg_pool = await asyncpg.create_pool(
+                _asyncpg_dsn(settings.DATABASE_URL),
+                min_size=4,
+                max_size=32,
+                # PgBouncer en modo transaction no conserva sentencias preparadas
+                statement_cache_size=0 if settings.DATABASE_PGBOUNCER else 100
+            )
             self._connected = True
             logger.info("Conexión a base de datos establecida exitosamente")
             
@@ -46,12 +90,15 @@ class DatabaseManager:
             try:
                 logger.info("Desconectando de la base de datos...")
                 await self.client.disconnect()
+                if self.pg_pool:
+                    await self.pg_pool.close()
                 self._connected = False
                 logger.info("Desconectado de la base de datos exitosamente")
             except Exception as e:
                 logger.error(f"Error desconectando de la base de datos: {str(e)}")
         
         self.client = None
+        self.pg_pool = None
     
     async def health_check(self) -> bool:
         """Verificar salud de la conexión a la base de datos"""
@@ -76,6 +123,12 @@ class DatabaseManager:
         if not self.client or not self._connected:
             raise RuntimeError("Base de datos no conectada")
         return self.client
+    
+    def get_pg_pool(self) -> asyncpg.Pool:
+        """Obtener el pool asyncpg"""
+        if not self.pg_pool or not self._connected:
+            raise RuntimeError("Base de datos no conectada")
+        return self.pg_pool
 
 
 # Instancia global del gestor de base de datos
@@ -3,10 +3,13 @@ Endpoints de análisis facial para Synthia Style API
 Maneja análisis de rostro y recomendaciones de estilo con sistema de suscripciones
 """
 
-from typing import List, Optional
+import asyncio
+from hashlib import blake2b
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import msgspec
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from fastapi.responses import JSONResponse
 
 from app.schemas.facial_analysis import (
@@ -16,19 +19,53 @@ from app.schemas.facial_analysis import (
 from app.schemas.common import APIResponse, PaginationParams, PaginatedResponse
 from app.core.security import get_current_user_id
 from app.db.database import get_db
-from app.services.gemini_service import gemini_service
+from app.services.gemini_service import (
+    gemini_service, GeminiCapacityError, GEMINI_RETRY_AFTER_SECONDS
+)
 from app.services.file_service import file_service
 from app.services.user_service import subscription_service, user_onboarding_service
 
 router = APIRouter()
 
 
-@router.post("/analyze", response_model=FacialAnalysisResponse)
+# ============= DTOs DE SALIDA (msgspec) =============
+# La respuesta de /analyze incluye el JSON completo de Gemini (ai_analysis_data);
+# con msgspec se codifica directamente sin validar ni revalidar con Pydantic.
+# FacialAnalysisResponse sigue documentando el contrato en OpenAPI.
+
+class FeatureHighlightOut(msgspec.Struct):
+    name: str
+    description: str
+    prominence: float
+
+
+class FacialAnalysisResultOut(msgspec.Struct):
+    id: str
+    user_id: str
+    image_url: str
+    face_shape: str
+    features_highlighted: List[FeatureHighlightOut]
+    confidence_level: float
+    ai_analysis_data: Dict[str, Any]
+    recommendations: List[Dict[str, Any]]
+    created_at: datetime
+    updated_at: datetime
+
+
+class FacialAnalysisResponseOut(msgspec.Struct):
+    analysis: FacialAnalysisResultOut
+    processing_time_ms: float
+
+
+_json_encoder = msgspec.json.Encoder()
+
+
+@router.post("/analyze", response_model=None, responses={200: {"model": FacialAnalysisResponse}})
 async def analyze_facial_features(
     analysis_request: FacialAnalysisRequest,
     current_user_id: str = Depends(get_current_user_id),
     db=Depends(get_db)
-) -> FacialAnalysisResponse:
+) -> Response:
     """
     Realizar análisis facial con IA - Incluye verificación de límites de suscripción
     """
@@ -50,16 +87,25 @@ async def analyze_facial_features(
         
         start_time = datetime.utcnow()
         
-        # Realizar análisis con Gemini AI
-        ai_result = await gemini_service.analyze_facial_features(
-            image_data=analysis_request.image_data,
-            user_id=current_user_id,
-            preferences=analysis_request.analysis_preferences
+        # Realizar análisis con Gemini AI; el usuario (para onboarding) se lee en
+        # paralelo porque no depende del resultado
+        ai_result, user = await asyncio.gather(
+            gemini_service.analyze_facial_features(
+                image_data=analysis_request.image_data,
+                user_id=current_user_id,
+                preferences=analysis_request.analysis_preferences
+            ),
+            db.user.find_unique(where={"id": current_user_id})
         )
         
         # Guardar imagen (opcional - convertir base64 a archivo)
-        # Por ahora, generamos una URL ficticia
-        image_url = f"/uploads/facial/{current_user_id}_{int(datetime.utcnow().timestamp())}.jpg"
+        # Por ahora, generamos una URL ficticia derivada del contenido: reutiliza el
+        # hash del cache de Gemini y un reintento con la misma imagen da la misma URL
+        image_hash = (
+            ai_result.get("cache_info", {}).get("image_hash")
+            or blake2b(analysis_request.image_data.encode(), digest_size=16).hexdigest()
+        )
+        image_url = f"/uploads/facial/{current_user_id}_{image_hash[:32]}.jpg"
         
         # Crear registro en la base de datos
         analysis_data = {
@@ -71,13 +117,13 @@ async def analyze_facial_features(
             "analysisData": ai_result
         }
         
-        facial_analysis = await db.facialanalysis.create(data=analysis_data)
-        
-        # Incrementar contadores de uso
-        await subscription_service.increment_usage(current_user_id, "facial")
+        # Guardar el análisis e incrementar contadores de uso en paralelo
+        facial_analysis, _ = await asyncio.gather(
+            db.facialanalysis.create(data=analysis_data),
+            subscription_service.increment_usage(current_user_id, "facial")
+        )
         
         # Verificar si es su primer análisis para onboarding
-        user = await db.user.find_unique(where={"id": current_user_id})
         if user and not user.onboardingCompleted:
             await user_onboarding_service.complete_onboarding_step(current_user_id, 4)
         
@@ -108,13 +154,13 @@ async def analyze_facial_features(
         processing_time = (end_time - start_time).total_seconds() * 1000
         
         # Construir respuesta
-        analysis_result = FacialAnalysisResult(
+        analysis_result = FacialAnalysisResultOut(
             id=facial_analysis.id,
             user_id=current_user_id,
             image_url=image_url,
-            face_shape=FaceShapeEnum(ai_result["forma_rostro"]),
+            face_shape=FaceShapeEnum(ai_result["forma_rostro"]).value,
             features_highlighted=[
-                {"name": feature, "description": feature, "prominence": 0.8}
+                FeatureHighlightOut(name=feature, description=feature, prominence=0.8)
                 for feature in ai_result.get("caracteristicas_destacadas", [])
             ],
             confidence_level=ai_result.get("confianza_analisis", 85),
@@ -124,13 +170,22 @@ async def analyze_facial_features(
             updated_at=facial_analysis.updatedAt
         )
         
-        return FacialAnalysisResponse(
-            analysis=analysis_result,
-            processing_time_ms=processing_time
+        return Response(
+            content=_json_encoder.encode(FacialAnalysisResponseOut(
+                analysis=analysis_result,
+                processing_time_ms=processing_time
+            )),
+            media_type="application/json"
         )
         
     except HTTPException:
         raise
+    except GeminiCapacityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(GEMINI_RETRY_AFTER_SECONDS)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
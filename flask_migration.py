@@ -20,7 +20,7 @@ from fastapi import (
     UploadFile,
     Form
 )
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.deps import get_db
@@ -35,30 +35,84 @@ from app.schemas.flask_migration import (
 )
 from app.schemas.common import ResponseModel
 from app.services.flask_migration_service import FlaskMigrationService
-from app.services.gemini_service import GeminiService
-from app.services.cache_service import CacheService
+from app.services.gemini_service import (
+    gemini_service, GeminiCapacityError, GEMINI_RETRY_AFTER_SECONDS
+)
+from app.services.cache_service import cache_service
 import base64
 from werkzeug.utils import secure_filename
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
-# Instanciar servicios (en producción usar dependency injection)
-cache_service = CacheService()
-gemini_service = GeminiService()
+# Instanciar servicios (en producción usar dependency injection); Gemini y cache
+# son las instancias globales compartidas con el resto de la API
 flask_service = FlaskMigrationService(gemini_service, cache_service)
 
 # Configuración de archivos (migrada de Flask)
 UPLOAD_FOLDER = settings.upload_path
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB por lectura
 
 def allowed_file(filename: str) -> bool:
     """Verifica si el archivo tiene extensión permitida (migrado de Flask)"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_supported_image(header: bytes) -> bool:
+    """Comprueba la firma (magic bytes) de JPEG, PNG o WEBP en la cabecera del archivo"""
+    return (
+        header.startswith(b"\xff\xd8\xff")
+        or header.startswith(b"\x89PNG\r\n\x1a\n")
+        or (header[:4] == b"RIFF" and header[8:12] == b"WEBP")
+    )
+
+def base64_image_header(image_base64: str) -> bytes:
+    """Decodifica solo los primeros 12 bytes de una imagen en base64 (admite data URL)"""
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.partition(",")[2]
+    try:
+        return base64.b64decode(image_base64[:16])
+    except ValueError:
+        return b""
+
+def check_base64_size(image_base64: str, max_size: int = MAX_CONTENT_LENGTH) -> None:
+    """Rechaza imágenes en base64 cuyo tamaño decodificado supere el límite de subida"""
+    if len(image_base64) * 3 // 4 > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Archivo demasiado grande. Máximo 16MB."
+        )
+
+async def read_upload_limited(upload: UploadFile, max_size: int = MAX_CONTENT_LENGTH) -> bytes:
+    """
+    Lee el archivo subido por bloques y corta en cuanto supera el límite,
+    sin cargar primero el archivo completo en memoria
+    """
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail="Archivo demasiado grande. Máximo 16MB."
+    )
+    
+    if upload.size is not None and upload.size > max_size:
+        raise too_large
+    
+    data = bytearray()
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        # La cabecera content-type la envía el cliente: validar la firma real
+        if not data and not is_supported_image(chunk[:12]):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El archivo no es una imagen JPG, PNG o WEBP válida"
+            )
+        data += chunk
+        if len(data) > max_size:
+            raise too_large
+    
+    return bytes(data)
+
 # =============================================================================
 # ENDPOINTS DE AUTENTICACIÓN (MIGRADOS DE FLASK)
 # =============================================================================
@@ -104,7 +158,7 @@ async def login(
         )
         
     except Exception as e:
-        logger.error(f"Login error: {e}")
+        logger.exception("Login error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error en el proceso de login"
@@ -153,7 +207,7 @@ async def signup(
         )
         
     except Exception as e:
-        logger.error(f"Signup error: {e}")
+        logger.exception("Signup error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error en el proceso de registro"
@@ -184,7 +238,7 @@ async def logout(
         )
         
     except Exception as e:
-        logger.error(f"Logout error: {e}")
+        logger.exception("Logout error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error en el proceso de logout"
@@ -219,7 +273,11 @@ async def get_current_user_session(request: Request) -> str:
 # ENDPOINTS DE ANÁLISIS FACIAL (MIGRADOS DE FLASK)
 # =============================================================================
 
-@router.post("/analysis/facial", response_model=FacialAnalysisResponse)
+# Los endpoints faciales devuelven ORJSONResponse directamente: el modelo solo
+# documenta la respuesta en OpenAPI y no se revalida la salida
+_FACIAL_RESPONSES = {200: {"model": FacialAnalysisResponse}}
+
+@router.post("/analysis/facial", response_model=None, responses=_FACIAL_RESPONSES)
 async def facial_analysis(
     request: FacialAnalysisRequest,
     user_id: str = Depends(get_current_user_session),
@@ -231,30 +289,46 @@ async def facial_analysis(
     try:
         logger.info(f"Facial analysis request for user {user_id}")
         
+        check_base64_size(request.image_base64)
+        if not is_supported_image(base64_image_header(request.image_base64)):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El archivo no es una imagen JPG, PNG o WEBP válida"
+            )
+        
         # Realizar análisis con Gemini
         analysis_result = await flask_service.analyze_face_with_gemini(request.image_base64)
+        result_data = analysis_result.dict()
         
         # Guardar resultado en sesión del usuario
         await flask_service.save_analysis_result(
             user_id=user_id,
             analysis_type="facial",
-            result=analysis_result.dict()
+            result=result_data
         )
         
-        return ResponseModel(
-            success=True,
-            data=analysis_result,
-            message="Análisis facial completado exitosamente"
-        )
+        return ORJSONResponse({
+            "success": True,
+            "data": result_data,
+            "message": "Análisis facial completado exitosamente"
+        })
         
+    except HTTPException:
+        raise
+    except GeminiCapacityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(GEMINI_RETRY_AFTER_SECONDS)}
+        )
     except Exception as e:
-        logger.error(f"Facial analysis error: {e}")
+        logger.exception("Facial analysis error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error en el análisis facial"
         )
 
-@router.post("/analysis/facial/upload", response_model=FacialAnalysisResponse)
+@router.post("/analysis/facial/upload", response_model=None, responses=_FACIAL_RESPONSES)
 async def facial_analysis_upload(
     facial_image: UploadFile = File(...),
     user_id: str = Depends(get_current_user_session),
@@ -274,17 +348,11 @@ async def facial_analysis_upload(
         if not allowed_file(facial_image.filename):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Tipo de archivo no permitido. Use JPG, JPEG o PNG."
-            )
-        
-        # Leer y convertir a base64
-        image_data = await facial_image.read()
-        if len(image_data) > MAX_CONTENT_LENGTH:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="Archivo demasiado grande. Máximo 16MB."
+                detail="Tipo de archivo no permitido. Use JPG, JPEG, PNG o WEBP."
             )
         
+        # Leer por bloques (con límite de tamaño) y convertir a base64
+        image_data = await read_upload_limited(facial_image)
         image_base64 = base64.b64encode(image_data).decode('utf-8')
         
         # Crear request y procesar
@@ -292,30 +360,77 @@ async def facial_analysis_upload(
         
         # Realizar análisis
         analysis_result = await flask_service.analyze_face_with_gemini(request.image_base64)
+        result_data = analysis_result.dict()
         
         # Guardar resultado
         await flask_service.save_analysis_result(
             user_id=user_id,
             analysis_type="facial",
-            result=analysis_result.dict()
+            result=result_data
         )
         
-        return ResponseModel(
-            success=True,
-            data=analysis_result,
-            message="Análisis facial completado exitosamente"
-        )
+        return ORJSONResponse({
+            "success": True,
+            "data": result_data,
+            "message": "Análisis facial completado exitosamente"
+        })
         
     except HTTPException:
         raise
+    except GeminiCapacityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(GEMINI_RETRY_AFTER_SECONDS)}
+        )
     except Exception as e:
-        logger.error(f"Facial analysis upload error: {e}")
+        logger.exception("Facial analysis upload error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error procesando la imagen"
         )
 
-@router.get("/analysis/facial/results", response_model=FacialAnalysisResponse)
+@router.post("/analysis/facial/stream")
+async def facial_analysis_stream(
+    request: FacialAnalysisRequest,
+    user_id: str = Depends(get_current_user_session)
+):
+    """
+    Análisis facial en streaming (NDJSON): el cliente recibe los fragmentos
+    de Gemini a medida que se generan en lugar de esperar la respuesta completa
+    """
+    logger.info(f"Facial analysis stream request for user {user_id}")
+    
+    check_base64_size(request.image_base64)
+    if not is_supported_image(base64_image_header(request.image_base64)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El archivo no es una imagen JPG, PNG o WEBP válida"
+        )
+    
+    if not gemini_service.model:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio de análisis no disponible"
+        )
+    
+    # Reservar el hueco antes de responder: una vez enviado el 200 ya no se
+    # puede contestar 429. El generador lo libera al terminar
+    try:
+        await gemini_service.reserve_slot()
+    except GeminiCapacityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(GEMINI_RETRY_AFTER_SECONDS)}
+        )
+    
+    return StreamingResponse(
+        gemini_service.stream_facial_analysis(request.image_base64),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/analysis/facial/results", response_model=None, responses=_FACIAL_RESPONSES)
 async def get_facial_results(
     user_id: str = Depends(get_current_user_session)
 ):
@@ -332,16 +447,16 @@ async def get_facial_results(
                 detail="No se encontraron resultados de análisis facial"
             )
         
-        return ResponseModel(
-            success=True,
-            data=results.get("result"),
-            message="Resultados de análisis facial obtenidos"
-        )
+        return ORJSONResponse({
+            "success": True,
+            "data": results.get("result"),
+            "message": "Resultados de análisis facial obtenidos"
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting facial results: {e}")
+        logger.exception("Error getting facial results")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error obteniendo resultados"
@@ -380,7 +495,7 @@ async def chromatic_analysis(
         )
         
     except Exception as e:
-        logger.error(f"Chromatic analysis error: {e}")
+        logger.exception("Chromatic analysis error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error en el análisis cromático"
@@ -412,7 +527,7 @@ async def get_chromatic_results(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting chromatic results: {e}")
+        logger.exception("Error getting chromatic results")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error obteniendo resultados"
@@ -454,7 +569,7 @@ async def submit_feedback(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Feedback submission error: {e}")
+        logger.exception("Feedback submission error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error procesando feedback"
@@ -514,7 +629,7 @@ async def dashboard(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Dashboard error: {e}")
+        logger.exception("Dashboard error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error cargando dashboard"
@@ -578,7 +693,7 @@ async def get_facial_results_react_format(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting React format facial results: {e}")
+        logger.exception("Error getting React format facial results")
         raise HTTPException(status_code=500, detail="Error getting results")
 
 @router.get("/analysis/chromatic/react-format")
@@ -628,7 +743,7 @@ async def get_chromatic_results_react_format(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting React format chromatic results: {e}")
+        logger.exception("Error getting React format chromatic results")
         raise HTTPException(status_code=500, detail="Error getting results")
 
 # =============================================================================
@@ -667,7 +782,7 @@ async def health_check():
         )
         
     except Exception as e:
-        logger.error(f"Health check error: {e}")
+        logger.exception("Health check error")
         return HealthCheck(
             status="unhealthy",
             database_connected=False,
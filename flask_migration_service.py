@@ -8,14 +8,16 @@ import json
 import uuid
 import asyncio
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Final
 import logging
 from PIL import Image
 import io
 import base64
 
+from pydantic import BaseModel, TypeAdapter
+
 from app.core.config import get_settings
-from app.services.gemini_service import GeminiService
+from app.services.gemini_service import GeminiService, GeminiCapacityError
 from app.services.cache_service import CacheService
 from app.schemas.flask_migration import (
     FaceShape, ColorSeason, SkinUndertone,
@@ -29,6 +31,43 @@ from app.schemas.flask_migration import (
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+
+class _GeminiFacialPayload(BaseModel):
+    """JSON de análisis facial devuelto por Gemini (valores por defecto como en Flask)"""
+    forma_rostro: str = "ovalado"
+    caracteristicas_destacadas: List[str] = []
+    proporciones: str = "Proporciones equilibradas"
+    confianza_analisis: float = 85
+
+
+# Formas faciales de Flask sin equivalente directo en FaceShape
+_FACE_SHAPE_COMPAT: Dict[str, FaceShape] = {
+    "rectangular": FaceShape.CUADRADO,
+    "diamante": FaceShape.OVALADO,
+    "triangular": FaceShape.CORAZON,
+    "corazón": FaceShape.OVALADO,
+    "triangulo_invertido": FaceShape.CORAZON
+}
+
+# Valida el texto JSON de Gemini en una sola pasada (parseo en Rust, sin json.loads)
+_GEMINI_FACIAL_ADAPTER = TypeAdapter(_GeminiFacialPayload)
+
+# Prompt de análisis facial (migrado de Flask), construido una sola vez al importar
+FACIAL_ANALYSIS_PROMPT: Final[str] = """
+Actúa como un experto en análisis facial y asesoría de imagen. Analiza la imagen proporcionada y determina:
+1. La forma del rostro (ovalado, redondo, cuadrado, rectangular, corazón, diamante o triangular)
+2. Características faciales destacadas (pómulos, mandíbula, frente)
+3. Proporciones faciales generales
+
+Responde en formato JSON con la siguiente estructura:
+{
+  "forma_rostro": "tipo",
+  "caracteristicas_destacadas": ["rasgo1", "rasgo2"],
+  "proporciones": "descripción",
+  "confianza_analisis": porcentaje
+}
+"""
+
 class FlaskMigrationService:
     """
     Servicio que contiene toda la lógica migrada del código Flask original
@@ -315,44 +354,28 @@ class FlaskMigrationService:
         Analiza una imagen facial usando Gemini API (migrado de Flask)
         """
         try:
-            # Cache key para evitar análisis duplicados
-            image_hash = hash(image_base64[:100])  # Hash de los primeros 100 chars
-            cache_key = f"facial_analysis:{image_hash}"
+            # Cache por contenido: sha256 de los bytes de la imagen, estable
+            # entre procesos (hash() de Python cambia en cada worker)
+            image_hash = await self.cache_service.create_image_hash(image_base64)
             
             # Verificar cache
-            cached_result = await self.cache_service.get(cache_key)
+            cached_result = await self.cache_service.get_analysis_cache(image_hash, "flask_facial")
             if cached_result:
                 logger.info("Returning cached facial analysis result")
-                return FacialAnalysisResult(**cached_result)
-            
-            # Prompt mejorado para Gemini
-            prompt = """
-            Actúa como un experto en análisis facial y asesoría de imagen. Analiza la imagen proporcionada y determina:
-            1. La forma del rostro (ovalado, redondo, cuadrado, rectangular, corazón, diamante o triangular)
-            2. Características faciales destacadas (pómulos, mandíbula, frente)
-            3. Proporciones faciales generales
-
-            Responde en formato JSON con la siguiente estructura:
-            {
-              "forma_rostro": "tipo",
-              "caracteristicas_destacadas": ["rasgo1", "rasgo2"],
-              "proporciones": "descripción",
-              "confianza_analisis": porcentaje
-            }
-            """
+                return FacialAnalysisResult(**cached_result["result"])
             
             # Llamar a Gemini
-            gemini_result = await self.gemini_service.analyze_image(
+            gemini_json = await self.gemini_service.analyze_image_json(
                 image_base64=image_base64,
-                prompt=prompt
+                prompt=FACIAL_ANALYSIS_PROMPT
             )
             
-            if not gemini_result:
+            if not gemini_json:
                 raise Exception("No response from Gemini API")
             
             # Procesar respuesta de Gemini
-            face_shape_str = gemini_result.get('forma_rostro', 'ovalado').lower()
-            face_shape = self._normalize_face_shape(face_shape_str)
+            gemini_result = _GEMINI_FACIAL_ADAPTER.validate_json(gemini_json)
+            face_shape = self._normalize_face_shape(gemini_result.forma_rostro.lower())
             
             # Obtener recomendaciones
             recommendations = self._get_facial_recommendations(face_shape)
@@ -360,24 +383,28 @@ class FlaskMigrationService:
             # Crear resultado estructurado
             result = FacialAnalysisResult(
                 forma_rostro=face_shape,
-                caracteristicas_destacadas=gemini_result.get('caracteristicas_destacadas', []),
-                proporciones=gemini_result.get('proporciones', 'Proporciones equilibradas'),
-                confianza_analisis=int(gemini_result.get('confianza_analisis', 85)),
+                caracteristicas_destacadas=gemini_result.caracteristicas_destacadas,
+                proporciones=gemini_result.proporciones,
+                confianza_analisis=int(gemini_result.confianza_analisis),
                 recomendaciones=recommendations
             )
             
             # Guardar en cache
-            await self.cache_service.set(
-                cache_key, 
-                result.dict(), 
+            await self.cache_service.set_analysis_cache(
+                image_hash,
+                "flask_facial",
+                result.dict(),
                 ttl=self.analysis_cache_ttl
             )
             
             logger.info(f"Facial analysis completed with shape: {face_shape}")
             return result
             
+        except GeminiCapacityError:
+            # Sin capacidad no hay análisis: no devolver (ni guardar) el fallback
+            raise
         except Exception as e:
-            logger.error(f"Error in facial analysis: {e}")
+            logger.exception("Error in facial analysis")
             # Fallback como en Flask original
             return FacialAnalysisResult(
                 forma_rostro=FaceShape.OVALADO,
@@ -391,20 +418,12 @@ class FlaskMigrationService:
         """
         Normaliza la forma facial desde string a enum (migrado de Flask)
         """
-        shape_mapping = {
-            "rectangular": FaceShape.CUADRADO,
-            "diamante": FaceShape.OVALADO,
-            "triangular": FaceShape.CORAZON,
-            "corazón": FaceShape.OVALADO,
-            "triangulo_invertido": FaceShape.CORAZON
-        }
-        
         # Intentar mapeo directo primero
         try:
             return FaceShape(face_shape_str)
         except ValueError:
             # Usar mapeo de compatibilidad
-            return shape_mapping.get(face_shape_str, FaceShape.OVALADO)
+            return _FACE_SHAPE_COMPAT.get(face_shape_str, FaceShape.OVALADO)
     
     def _get_facial_recommendations(self, face_shape: FaceShape) -> FacialRecommendations:
         """
@@ -501,7 +520,7 @@ class FlaskMigrationService:
             return result
             
         except Exception as e:
-            logger.error(f"Error in chromatic analysis: {e}")
+            logger.exception("Error in chromatic analysis")
             # Fallback
             return ChromaticAnalysisResult(
                 estacion=ColorSeason.INVIERNO,
@@ -595,7 +614,7 @@ class FlaskMigrationService:
             return False
             
         except Exception as e:
-            logger.error(f"Error saving analysis result: {e}")
+            logger.exception("Error saving analysis result")
             return False
     
     async def get_analysis_results(self, user_id: str, analysis_type: str) -> Optional[Dict[str, Any]]:
@@ -607,7 +626,7 @@ class FlaskMigrationService:
             analysis_results = user_data.get('analysis_results', {})
             return analysis_results.get(analysis_type)
         except Exception as e:
-            logger.error(f"Error getting analysis results: {e}")
+            logger.exception("Error getting analysis results")
             return None
     
     async def save_user_feedback(
@@ -636,7 +655,7 @@ class FlaskMigrationService:
             return False
             
         except Exception as e:
-            logger.error(f"Error saving feedback: {e}")
+            logger.exception("Error saving feedback")
             return False
     
     async def logout_user(self, user_id: str) -> bool:
@@ -650,5 +669,5 @@ class FlaskMigrationService:
                 return True
             return False
         except Exception as e:
-            logger.error(f"Error logging out user: {e}")
+            logger.exception("Error logging out user")
             return False
@@ -3,12 +3,14 @@ Servicio de integración con Google Gemini AI con cache Redis
 Maneja análisis facial y cromático usando la API de Gemini con optimización de performance
 """
 
-import json
+import re
 import asyncio
 import base64
-from typing import Optional, Dict, Any, List
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, AsyncIterator, AsyncGenerator, Final
 from datetime import datetime
 
+import orjson
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 from PIL import Image
@@ -27,21 +29,95 @@ except ImportError:
     CACHE_AVAILABLE = False
 
 
+# Modo JSON estructurado: Gemini devuelve JSON puro, sin fences ni texto extra
+_JSON_MODE: Final[Dict[str, str]] = {"response_mime_type": "application/json"}
+
+# Fences de markdown (```json ... ```) al inicio o final de la respuesta
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+
+# Segundos sugeridos al cliente (Retry-After) cuando Gemini está saturado
+GEMINI_RETRY_AFTER_SECONDS = 5
+
+
+# Prompt de análisis facial: sin interpolación, se construye una sola vez al importar
+GEMINI_FACIAL_PROMPT: Final[str] = """
+Actúa como un experto en análisis facial y asesoría de imagen. Analiza la imagen proporcionada y determina:
+
+1. Forma del rostro: Identifica la forma principal del rostro (ovalado, redondo, cuadrado, rectangular, corazón, diamante o triangular).
+
+2. Características destacadas: Identifica 3-5 características faciales destacadas específicas.
+
+3. Nivel de confianza: Indica tu nivel de confianza en el análisis en una escala del 1 al 100.
+
+Basado en la forma del rostro identificada, proporciona recomendaciones específicas para:
+A. Cortes de pelo: 3 estilos que favorezcan esta forma facial, con explicación detallada.
+B. Gafas: 2 tipos de monturas que complementen esta forma facial, con explicación.
+C. Escotes: 2 tipos de escotes que favorezcan esta forma facial, con explicación.
+
+Responde ÚNICAMENTE con un JSON válido con la siguiente estructura exacta:
+{
+  "forma_rostro": "forma identificada",
+  "caracteristicas_destacadas": ["característica 1", "característica 2", "característica 3"],
+  "confianza_analisis": número_del_1_al_100,
+  "recomendaciones": {
+    "cortes_pelo": [
+      {"nombre": "nombre del corte", "descripcion": "descripción breve", "explicacion": "explicación detallada de por qué favorece esta forma"}
+    ],
+    "gafas": [
+      {"tipo": "tipo de montura", "explicacion": "explicación detallada de por qué es adecuada"}
+    ],
+    "escotes": [
+      {"tipo": "tipo de escote", "explicacion": "explicación detallada de por qué favorece"}
+    ]
+  }
+}
+
+IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
+"""
+
+# Normalización de las respuestas de Gemini a los enums del dominio
+_FACE_SHAPE_MAP: Dict[str, FaceShapeEnum] = {
+    'ovalado': FaceShapeEnum.OVALADO,
+    'redondo': FaceShapeEnum.REDONDO,
+    'cuadrado': FaceShapeEnum.CUADRADO,
+    'rectangular': FaceShapeEnum.RECTANGULAR,
+    'corazón': FaceShapeEnum.CORAZÓN,
+    'diamante': FaceShapeEnum.DIAMANTE,
+    'triangular': FaceShapeEnum.TRIANGULAR
+}
+
+_SEASON_MAP: Dict[str, ColorSeasonEnum] = {
+    'invierno': ColorSeasonEnum.INVIERNO,
+    'primavera': ColorSeasonEnum.PRIMAVERA,
+    'verano': ColorSeasonEnum.VERANO,
+    'otoño': ColorSeasonEnum.OTOÑO
+}
+
+_UNDERTONE_MAP: Dict[str, SkinUndertoneEnum] = {
+    'frío': SkinUndertoneEnum.FRIO,
+    'cálido': SkinUndertoneEnum.CALIDO,
+    'neutro': SkinUndertoneEnum.NEUTRO
+}
+
+
+class GeminiCapacityError(Exception):
+    """Se alcanzó el límite de llamadas simultáneas a Gemini"""
+
+
 class GeminiService:
     """Servicio para interacciones con Google Gemini AI"""
     
     def __init__(self):
         """Inicializar servicio Gemini"""
         self.api_key = settings.GEMINI_API_KEY
-        self.facial_model_name = "gemini-2.5-flash"
-        self.chromatic_model_name = "gemini-2.5-flash"
+        self.facial_model_name = settings.GEMINI_FACIAL_MODEL
+        self.chromatic_model_name = settings.GEMINI_CHROMATIC_MODEL
         
-        # Configurar Gemini
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel(self.facial_model_name)
-        else:
-            self.model = None
+        # El modelo se crea en el primer uso (ver propiedad model)
+        self._model: Optional[genai.GenerativeModel] = None
+        
+        # Límite de llamadas en vuelo: al llenarse se rechaza en lugar de encolar
+        self._inflight = asyncio.Semaphore(settings.GEMINI_MAX_INFLIGHT)
             
         # Configuración de seguridad
         self.safety_settings = {
@@ -51,25 +127,51 @@ class GeminiService:
             HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
         }
     
-    def _parse_json_response(self, text: str) -> Optional[Dict[str, Any]]:
-        """
-        Parsear respuesta JSON de Gemini, manejando formato markdown
+    @property
+    def model(self) -> Optional[genai.GenerativeModel]:
         """
-        if not text:
-            return None
+        Modelo Gemini, configurado de forma perezosa en el primer uso
         
-        # Limpiar texto
-        processed_text = text.strip()
-        
-        # Remover markdown fences si existen
-        if processed_text.startswith("```json"):
-            processed_text = processed_text[7:]
-        if processed_text.startswith("```"):
-            processed_text = processed_text[3:]
-        if processed_text.endswith("```"):
-            processed_text = processed_text[:-3]
+        Importar el módulo no toca el SDK; sin API key devuelve None y los
+        métodos responden como servicio no configurado.
+        """
+        if self._model is None and self.api_key:
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(self.facial_model_name)
+        return self._model
+    
+    async def reserve_slot(self) -> None:
+        """
+        Reservar un hueco para una llamada a Gemini
         
-        processed_text = processed_text.strip()
+        Si todos los huecos están ocupados lanza GeminiCapacityError de inmediato,
+        así la latencia no crece con una cola de peticiones esperando a la API.
+        Cada reserva debe liberarse con release_slot().
+        """
+        if self._inflight.locked():
+            raise GeminiCapacityError("Servicio de IA saturado, intenta nuevamente")
+        # Hay hueco libre: acquire retorna sin suspender
+        await self._inflight.acquire()
+    
+    def release_slot(self) -> None:
+        """Liberar un hueco reservado con reserve_slot()"""
+        self._inflight.release()
+    
+    @asynccontextmanager
+    async def _gemini_slot(self) -> AsyncGenerator[None, None]:
+        """Mantener un hueco de Gemini durante el bloque"""
+        await self.reserve_slot()
+        try:
+            yield
+        finally:
+            self.release_slot()
+    
+    def _extract_json_text(self, text: str) -> str:
+        """
+        Extraer el objeto JSON de la respuesta de Gemini, sin markdown fences
+        """
+        # Limpiar texto y remover markdown fences si existen
+        processed_text = _FENCE_RE.sub("", text.strip()).strip()
         
         # Extraer JSON entre llaves
         first_brace = processed_text.find('{')
@@ -78,28 +180,49 @@ class GeminiService:
         if first_brace == -1 or last_brace == -1 or last_brace < first_brace:
             raise ValueError("No se encontró estructura JSON válida")
         
-        json_str = processed_text[first_brace:last_brace + 1]
+        return processed_text[first_brace:last_brace + 1]
+    
+    def _parse_json_response(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Parsear respuesta JSON de Gemini, manejando formato markdown
+        """
+        if not text:
+            return None
         
+        # En modo JSON la respuesta ya es JSON puro: una sola pasada con orjson
         try:
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+        
+        # Respuestas sin modo JSON (o decoradas igualmente): limpiar y extraer
+        json_str = self._extract_json_text(text)
+        
+        try:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError as e:
             # Intentar corregir errores comunes
             try:
                 # Remover comas finales
                 fixed_str = json_str.replace(',}', '}').replace(',]', ']')
-                return json.loads(fixed_str)
-            except json.JSONDecodeError:
+                return orjson.loads(fixed_str)
+            except orjson.JSONDecodeError:
                 raise ValueError(f"Error parseando JSON: {str(e)}")
     
-    def _validate_image_data(self, image_data: str) -> Image.Image:
+    def _validate_image_data(self, image_data: str) -> Dict[str, Any]:
         """
-        Validar y procesar datos de imagen base64
+        Validar imagen base64 y devolverla como blob inline para Gemini
+        
+        PIL solo lee la cabecera (formato y dimensiones) sin decodificar píxeles,
+        y se envían los bytes originales: pasar un PIL.Image hace que el SDK lo
+        recodifique, y una foto JPEG de varios MB puede convertirse en un PNG
+        mucho más pesado en cada petición.
         """
         try:
             # Decodificar base64
             image_bytes = base64.b64decode(image_data)
             
-            # Abrir imagen con PIL
+            # Abrir imagen con PIL (lectura perezosa de la cabecera)
             image = Image.open(io.BytesIO(image_bytes))
             
             # Validar formato
@@ -113,52 +236,14 @@ class GeminiService:
             if image.width > 4096 or image.height > 4096:
                 raise ValueError("La imagen es demasiado grande (máximo 4096x4096)")
             
-            # Convertir a RGB si es necesario
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            return image
+            return {
+                "mime_type": Image.MIME[image.format],
+                "data": image_bytes
+            }
             
         except Exception as e:
             raise ValueError(f"Error procesando imagen: {str(e)}")
     
-    def _generate_facial_analysis_prompt(self) -> str:
-        """Generar prompt para análisis facial"""
-        return """
-Actúa como un experto en análisis facial y asesoría de imagen. Analiza la imagen proporcionada y determina:
-
-1. Forma del rostro: Identifica la forma principal del rostro (ovalado, redondo, cuadrado, rectangular, corazón, diamante o triangular).
-
-2. Características destacadas: Identifica 3-5 características faciales destacadas específicas.
-
-3. Nivel de confianza: Indica tu nivel de confianza en el análisis en una escala del 1 al 100.
-
-Basado en la forma del rostro identificada, proporciona recomendaciones específicas para:
-A. Cortes de pelo: 3 estilos que favorezcan esta forma facial, con explicación detallada.
-B. Gafas: 2 tipos de monturas que complementen esta forma facial, con explicación.
-C. Escotes: 2 tipos de escotes que favorezcan esta forma facial, con explicación.
-
-Responde ÚNICAMENTE con un JSON válido con la siguiente estructura exacta:
-{
-  "forma_rostro": "forma identificada",
-  "caracteristicas_destacadas": ["característica 1", "característica 2", "característica 3"],
-  "confianza_analisis": número_del_1_al_100,
-  "recomendaciones": {
-    "cortes_pelo": [
-      {"nombre": "nombre del corte", "descripcion": "descripción breve", "explicacion": "explicación detallada de por qué favorece esta forma"}
-    ],
-    "gafas": [
-      {"tipo": "tipo de montura", "explicacion": "explicación detallada de por qué es adecuada"}
-    ],
-    "escotes": [
-      {"tipo": "tipo de escote", "explicacion": "explicación detallada de por qué favorece"}
-    ]
-  }
-}
-
-IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
-"""
-    
     def _generate_chromatic_analysis_prompt(self, quiz_responses: Dict[str, str]) -> str:
         """Generar prompt para análisis cromático"""
         responses_text = "\n".join([
@@ -254,14 +339,15 @@ IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
             image = self._validate_image_data(image_data)
             
             # Generar prompt
-            prompt = self._generate_facial_analysis_prompt()
+            prompt = GEMINI_FACIAL_PROMPT
             
             # Realizar consulta a Gemini
-            response = await asyncio.to_thread(
-                self.model.generate_content,
-                [prompt, image],
-                safety_settings=self.safety_settings
-            )
+            async with self._gemini_slot():
+                response = await self.model.generate_content_async(
+                    [prompt, image],
+                    safety_settings=self.safety_settings,
+                    generation_config=_JSON_MODE
+                )
             
             # Parsear respuesta
             result = self._parse_json_response(response.text)
@@ -277,17 +363,7 @@ IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
             
             # Normalizar forma de rostro
             face_shape = result['forma_rostro'].lower()
-            face_shape_mapping = {
-                'ovalado': FaceShapeEnum.OVALADO,
-                'redondo': FaceShapeEnum.REDONDO,
-                'cuadrado': FaceShapeEnum.CUADRADO,
-                'rectangular': FaceShapeEnum.RECTANGULAR,
-                'corazón': FaceShapeEnum.CORAZÓN,
-                'diamante': FaceShapeEnum.DIAMANTE,
-                'triangular': FaceShapeEnum.TRIANGULAR
-            }
-            
-            result['forma_rostro'] = face_shape_mapping.get(face_shape, FaceShapeEnum.UNKNOWN)
+            result['forma_rostro'] = _FACE_SHAPE_MAP.get(face_shape, FaceShapeEnum.UNKNOWN)
             
             # Calcular tiempo de respuesta
             end_time = datetime.utcnow()
@@ -393,11 +469,12 @@ IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
             prompt = self._generate_chromatic_analysis_prompt(quiz_responses)
             
             # Realizar consulta a Gemini
-            response = await asyncio.to_thread(
-                self.model.generate_content,
-                prompt,
-                safety_settings=self.safety_settings
-            )
+            async with self._gemini_slot():
+                response = await self.model.generate_content_async(
+                    prompt,
+                    safety_settings=self.safety_settings,
+                    generation_config=_JSON_MODE
+                )
             
             # Parsear respuesta
             result = self._parse_json_response(response.text)
@@ -412,24 +489,11 @@ IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
                     raise ValueError(f"Campo requerido faltante: {field}")
             
             # Normalizar estación y subtono
-            season_mapping = {
-                'invierno': ColorSeasonEnum.INVIERNO,
-                'primavera': ColorSeasonEnum.PRIMAVERA,
-                'verano': ColorSeasonEnum.VERANO,
-                'otoño': ColorSeasonEnum.OTOÑO
-            }
-            
-            undertone_mapping = {
-                'frío': SkinUndertoneEnum.FRIO,
-                'cálido': SkinUndertoneEnum.CALIDO,
-                'neutro': SkinUndertoneEnum.NEUTRO
-            }
-            
             season = result['estacion'].lower()
             undertone = result['subtono'].lower()
             
-            result['estacion'] = season_mapping.get(season, ColorSeasonEnum.UNKNOWN)
-            result['subtono'] = undertone_mapping.get(undertone, SkinUndertoneEnum.UNKNOWN)
+            result['estacion'] = _SEASON_MAP.get(season, ColorSeasonEnum.UNKNOWN)
+            result['subtono'] = _UNDERTONE_MAP.get(undertone, SkinUndertoneEnum.UNKNOWN)
             
             # Calcular tiempo de respuesta
             end_time = datetime.utcnow()
@@ -491,11 +555,11 @@ IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
             
             # Test simple
             start_time = datetime.utcnow()
-            response = await asyncio.to_thread(
-                self.model.generate_content,
-                "Responde solo 'OK'",
-                safety_settings=self.safety_settings
-            )
+            async with self._gemini_slot():
+                response = await self.model.generate_content_async(
+                    "Responde solo 'OK'",
+                    safety_settings=self.safety_settings
+                )
             end_time = datetime.utcnow()
             
             response_time = (end_time - start_time).total_seconds() * 1000
@@ -532,14 +596,14 @@ IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
                 raise ValueError("Gemini no está configurado")
             
             # Procesar imagen
-            image = self._process_image(image_base64)
+            image = self._validate_image_data(image_base64)
             
             # Realizar consulta a Gemini
-            response = await asyncio.to_thread(
-                self.model.generate_content,
-                [prompt, image],
-                safety_settings=self.safety_settings
-            )
+            async with self._gemini_slot():
+                response = await self.model.generate_content_async(
+                    [prompt, image],
+                    safety_settings=self.safety_settings
+                )
             
             # Parsear respuesta JSON
             result = self._parse_json_response(response.text)
@@ -560,6 +624,85 @@ IMPORTANTE: Responde SOLO con el JSON, sin texto adicional antes o después.
                 metadata={"prompt_length": len(prompt), "image_size": len(image_base64)}
             )
             return None
+    
+    async def analyze_image_json(self, image_base64: str, prompt: str) -> Optional[str]:
+        """
+        Analizar imagen y devolver el JSON de Gemini como texto, sin parsear
+        
+        Pensado para validar directamente contra un modelo con
+        TypeAdapter.validate_json, en una sola pasada.
+        """
+        try:
+            if not self.model:
+                raise ValueError("Gemini no está configurado")
+            
+            image = self._validate_image_data(image_base64)
+            
+            async with self._gemini_slot():
+                response = await self.model.generate_content_async(
+                    [prompt, image],
+                    safety_settings=self.safety_settings,
+                    generation_config=_JSON_MODE
+                )
+            
+            if not response.text:
+                return None
+            
+            return self._extract_json_text(response.text)
+            
+        except GeminiCapacityError:
+            # Saturación: el llamador debe responder 429, no tratarla como fallo
+            raise
+        except Exception as e:
+            AILogger.log_ai_error(
+                error_type="image_analysis_error",
+                error_message=str(e),
+                metadata={"prompt_length": len(prompt), "image_size": len(image_base64)}
+            )
+            return None
+    
+    async def stream_facial_analysis(self, image_data: str) -> AsyncIterator[bytes]:
+        """
+        Análisis facial en streaming: una línea NDJSON por fragmento de Gemini
+        
+        Con response_mime_type JSON el texto concatenado de los fragmentos es
+        el mismo objeto que devuelve analyze_facial_features sin normalizar;
+        la última línea es {"type": "done"} o {"type": "error"}.
+        
+        El llamador reserva el hueco con reserve_slot() antes de empezar la
+        respuesta (para poder contestar 429); el stream lo libera al terminar.
+        """
+        try:
+            if not self.model:
+                raise ValueError("Servicio Gemini no configurado correctamente")
+            
+            # Dentro del try: la respuesta ya empezó, los errores van como línea NDJSON
+            image = self._validate_image_data(image_data)
+            prompt = GEMINI_FACIAL_PROMPT
+            
+            # El hueco (ya reservado) se mantiene mientras llegan los fragmentos
+            response = await self.model.generate_content_async(
+                [prompt, image],
+                safety_settings=self.safety_settings,
+                generation_config=_JSON_MODE,
+                stream=True
+            )
+            
+            async for chunk in response:
+                if chunk.text:
+                    yield orjson.dumps({"type": "chunk", "text": chunk.text}) + b"\n"
+            
+            yield orjson.dumps({"type": "done"}) + b"\n"
+            
+        except Exception as e:
+            AILogger.log_ai_error(
+                error_type="facial_stream_error",
+                error_message=str(e),
+                metadata={"image_size": len(image_data)}
+            )
+            yield orjson.dumps({"type": "error", "message": "Error en el análisis facial"}) + b"\n"
+        finally:
+            self.release_slot()
 
 
 # Instancia global del servicio
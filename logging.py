@@ -6,6 +6,10 @@ Utiliza loguru y structlog para logging avanzado
 import os
 import sys
 import json
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from typing import Any, Dict
 from datetime import datetime
 
@@ -16,6 +20,32 @@ from fastapi import Request
 from app.core.config import settings
 
 
+# Listener del logging estándar: los módulos que usan logging.getLogger solo
+# encolan el registro y un hilo aparte hace la escritura a stdout
+_stdlib_listener: QueueListener = None
+
+
+def _configure_stdlib_logging():
+    """Enrutar el logging estándar a través de QueueHandler -> QueueListener"""
+    global _stdlib_listener
+    if _stdlib_listener is not None:
+        return
+    
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(
+        "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s"
+    ))
+    
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(settings.LOG_LEVEL)
+    
+    _stdlib_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _stdlib_listener.start()
+    atexit.register(_stdlib_listener.stop)
+
+
 def configure_logging():
     """
     Configurar el sistema de logging de la aplicación
@@ -37,7 +67,8 @@ def configure_logging():
                    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
                    "<level>{message}</level>",
             level=settings.LOG_LEVEL,
-            colorize=True
+            colorize=True,
+            enqueue=True
         )
     
     # Handler para archivo (siempre activo)
@@ -48,9 +79,12 @@ def configure_logging():
         rotation="10 MB",
         retention="7 days",
         compression="gz",
-        serialize=settings.LOG_FORMAT == "json"
+        serialize=settings.LOG_FORMAT == "json",
+        enqueue=True  # Escritura en un hilo aparte, sin bloquear el event loop
     )
     
+    _configure_stdlib_logging()
+    
     # Configurar structlog
     structlog.configure(
         processors=[
@@ -3,15 +3,19 @@ Aplicación principal FastAPI para Synthia Style
 Configuración de la aplicación, middleware y rutas
 """
 
+import asyncio
 import time
 from contextlib import asynccontextmanager
 from typing import Dict, Any
 
+import anyio
+from loguru import logger
+
 from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from app.core.config import settings
@@ -24,6 +28,8 @@ from app.core.logging import (
 from app.core.security import CORS_CONFIG
 from app.db.database import startup_database, shutdown_database
 from app.api.v1.api import api_router
+from app.api.v1.endpoints.affiliates import run_click_flusher
+from app.api.v1.endpoints.auth import warmup_email_filter
 from app.services.cache_service import cache_service
 from app.core.cache_middleware import create_cache_middleware, create_cache_metrics_middleware
 
@@ -33,19 +39,34 @@ async def lifespan(app: FastAPI):
     """
     Gestión del ciclo de vida de la aplicación
     """
+    click_flusher = None
+    email_filter_warmup = None
+    
     # Startup
     try:
         log_startup_info()
         
+        # uvloop debe estar activo; uvicorn cae en silencio a asyncio si falta
+        if not type(asyncio.get_event_loop_policy()).__module__.startswith("uvloop"):
+            logger.warning("uvloop no está activo: el servidor usa el event loop de asyncio")
+        
+        # Ampliar el pool de hilos de anyio (endpoints y dependencias síncronas)
+        anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_MAX_WORKERS
+        
         # Inicializar base de datos
         await startup_database()
         
         # Inicializar cache Redis
         cache_initialized = await cache_service.initialize()
         if cache_initialized:
-            print("✅ Redis cache initialized successfully")
+            logger.info("Redis cache initialized successfully")
+            # Filtro Bloom de emails para forgot-password, en segundo plano
+            email_filter_warmup = asyncio.create_task(warmup_email_filter())
         else:
-            print("⚠️  Redis cache initialization failed or disabled")
+            logger.warning("Redis cache initialization failed or disabled")
+        
+        # Persistencia por lotes de clicks de afiliados
+        click_flusher = asyncio.create_task(run_click_flusher())
         
         yield
         
@@ -53,6 +74,22 @@ async def lifespan(app: FastAPI):
         # Shutdown
         log_shutdown_info()
         
+        # Detener flusher (vacía el buffer pendiente al cancelarse)
+        if click_flusher is not None:
+            click_flusher.cancel()
+            try:
+                await click_flusher
+            except asyncio.CancelledError:
+                pass
+        
+        # La carga del filtro usa BD y Redis: detenerla antes de cerrarlos
+        if email_filter_warmup is not None:
+            email_filter_warmup.cancel()
+            try:
+                await email_filter_warmup
+            except asyncio.CancelledError:
+                pass
+        
         # Cerrar conexiones
         await shutdown_database()
         await cache_service.close()
@@ -66,6 +103,8 @@ app = FastAPI(
     docs_url="/docs" if settings.DEBUG else None,
     redoc_url="/redoc" if settings.DEBUG else None,
     openapi_url="/openapi.json" if settings.DEBUG else None,
+    # orjson serializa datetimes, enums y UUID en C para todas las rutas
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -129,14 +168,15 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     )
     
     # Respuesta de error estandarizada
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "status": "error",
             "message": exc.detail,
             "error_code": f"HTTP_{exc.status_code}",
             "timestamp": time.time()
-        }
+        },
+        headers=getattr(exc, "headers", None)  # p. ej. Retry-After en los 429
     )
 
 
@@ -157,7 +197,7 @@ async def general_exception_handler(request: Request, exc: Exception):
     else:
         detail = str(exc)
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "status": "error",
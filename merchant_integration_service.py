@@ -4,7 +4,6 @@
 # Servicio para integración con merchants y gestión de afiliados
 
 import asyncio
-import aiohttp
 import json
 import hashlib
 from datetime import datetime, timedelta
@@ -667,13 +666,15 @@ class MerchantIntegrationService:
         product_id: str,
         user_id: str,
         affiliate_link: str,
-        source: str = "recommendation"
+        source: str = "recommendation",
+        tracking_id: Optional[str] = None
     ) -> str:
         """
         Registra un click en link de afiliado y retorna tracking ID
         """
         try:
-            tracking_id = hashlib.md5(f"{user_id}:{product_id}:{datetime.now().isoformat()}".encode()).hexdigest()
+            if not tracking_id:
+                tracking_id = hashlib.md5(f"{user_id}:{product_id}:{datetime.now().isoformat()}".encode()).hexdigest()
             
             # Datos de tracking
             tracking_data = {
@@ -4,7 +4,7 @@ Endpoints para la gestión de outfits y generación de combinaciones
 
 import logging
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from fastapi.security import HTTPBearer
 
 from app.schemas.wardrobe import (
@@ -13,7 +13,7 @@ from app.schemas.wardrobe import (
     OutfitStats, OutfitStatus, Occasion, Season, ClothingStyle
 )
 from app.services.wardrobe_service import WardrobeService
-from app.core.security import get_current_user
+from app.core.security import TokenUser, get_current_user, get_current_user_db
 from app.models.user import User
 
 logger = logging.getLogger(__name__)
@@ -24,11 +24,17 @@ router = APIRouter(prefix="/outfits", tags=["outfits"])
 # Inicializar servicio
 wardrobe_service = WardrobeService()
 
-@router.post("/generate", response_model=OutfitGenerationResponse)
+# El servicio ya devuelve un OutfitGenerationResponse construido con datos validados:
+# se serializa directamente y el modelo solo documenta la respuesta en OpenAPI
+@router.post(
+    "/generate",
+    response_model=None,
+    responses={200: {"model": OutfitGenerationResponse}}
+)
 async def generate_outfit_suggestions(
     request: OutfitGenerationRequest,
-    current_user: User = Depends(get_current_user)
-):
+    current_user: TokenUser = Depends(get_current_user)
+) -> Response:
     """
     Generar sugerencias automáticas de outfits basadas en el armario del usuario
     
@@ -46,16 +52,19 @@ async def generate_outfit_suggestions(
             request=request
         )
         
-        return suggestions
+        return Response(
+            content=suggestions.model_dump_json(),
+            media_type="application/json"
+        )
         
     except Exception as e:
-        logger.error(f"Error generating outfit suggestions: {str(e)}")
+        logger.exception("Error generating outfit suggestions user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("", response_model=OutfitResponse)
 async def create_outfit(
     outfit_data: OutfitCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Crear un nuevo outfit guardado
@@ -85,12 +94,12 @@ async def create_outfit(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error creating outfit: {str(e)}")
+        logger.exception("Error creating outfit user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("", response_model=List[OutfitResponse])
 async def get_outfits(
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_user),
     occasion: Optional[Occasion] = Query(None, description="Filtrar por ocasión"),
     season: Optional[Season] = Query(None, description="Filtrar por temporada"),
     status: Optional[OutfitStatus] = Query(None, description="Filtrar por estado"),
@@ -117,13 +126,13 @@ async def get_outfits(
         return outfits
         
     except Exception as e:
-        logger.error(f"Error getting outfits: {str(e)}")
+        logger.exception("Error getting outfits user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{outfit_id}", response_model=OutfitResponse)
 async def get_outfit(
     outfit_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Obtener un outfit específico con todos sus items
@@ -144,14 +153,14 @@ async def get_outfit(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting outfit: {str(e)}")
+        logger.exception("Error getting outfit user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{outfit_id}", response_model=OutfitResponse)
 async def update_outfit(
     outfit_id: str,
     update_data: OutfitUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Actualizar un outfit existente
@@ -172,13 +181,13 @@ async def update_outfit(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error updating outfit: {str(e)}")
+        logger.exception("Error updating outfit user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{outfit_id}")
 async def delete_outfit(
     outfit_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Eliminar un outfit
@@ -191,13 +200,13 @@ async def delete_outfit(
         return {"message": "Outfit eliminado exitosamente"}
         
     except Exception as e:
-        logger.error(f"Error deleting outfit: {str(e)}")
+        logger.exception("Error deleting outfit user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/{outfit_id}/wear")
 async def record_outfit_wear(
     outfit_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Registrar que se usó un outfit
@@ -226,13 +235,13 @@ async def record_outfit_wear(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error recording outfit wear: {str(e)}")
+        logger.exception("Error recording outfit wear user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{outfit_id}/alternatives")
 async def get_outfit_alternatives(
     outfit_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_user),
     max_alternatives: int = Query(3, ge=1, le=10, description="Máximo de alternativas")
 ):
     """
@@ -273,12 +282,12 @@ async def get_outfit_alternatives(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting outfit alternatives: {str(e)}")
+        logger.exception("Error getting outfit alternatives user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/stats/overview", response_model=OutfitStats)
 async def get_outfit_stats(
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Obtener estadísticas de outfits del usuario
@@ -339,12 +348,12 @@ async def get_outfit_stats(
         return stats
         
     except Exception as e:
-        logger.error(f"Error getting outfit stats: {str(e)}")
+        logger.exception("Error getting outfit stats user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/daily/suggestions")
 async def get_daily_outfit_suggestions(
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_user),
     date: Optional[str] = Query(None, description="Fecha en formato YYYY-MM-DD"),
     weather: Optional[str] = Query(None, description="Condiciones climáticas"),
     temperature: Optional[float] = Query(None, description="Temperatura en celsius"),
@@ -399,14 +408,14 @@ async def get_daily_outfit_suggestions(
         }
         
     except Exception as e:
-        logger.error(f"Error getting daily suggestions: {str(e)}")
+        logger.exception("Error getting daily suggestions user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/{outfit_id}/rate")
 async def rate_outfit(
     outfit_id: str,
     rating: float = Query(..., ge=0, le=5, description="Calificación del outfit (0-5)"),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Calificar un outfit
@@ -432,5 +441,5 @@ async def rate_outfit(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error rating outfit: {str(e)}")
+        logger.exception("Error rating outfit user=%s", current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
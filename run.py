@@ -13,5 +13,8 @@ if __name__ == "__main__":
         reload=settings.DEBUG,
         log_level=settings.LOG_LEVEL.lower(),
         access_log=True,
-        use_colors=True
+        use_colors=True,
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=settings.LIMIT_CONCURRENCY
     )
@@ -3,48 +3,200 @@ Sistema de seguridad y autenticación para Synthia Style
 Maneja autenticación JWT, hashing de contraseñas y validaciones de seguridad
 """
 
+import asyncio
+import os
+import re
 import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
 from datetime import datetime, timedelta
-from typing import Any, Union, Optional
+from typing import Any, NamedTuple, Union, Optional
 
 import bcrypt
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import HTTPException, status
+import jwt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from app.core.config import settings
 from app.core.logging import SecurityLogger
+from app.db.database import get_db
+from app.schemas.user import UserRole
+from app.services.cache_service import cache_service
 
 
-# Configuración de hash de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Argon2id; por defecto los parámetros recomendados por OWASP (64 MB, 3 iteraciones,
+# 2 hilos), configurables de forma central en settings
+password_hasher = PasswordHasher(
+    time_cost=settings.PASSWORD_HASH_TIME_COST,
+    memory_cost=settings.PASSWORD_HASH_MEMORY_KB,
+    parallelism=settings.PASSWORD_HASH_PARALLELISM,
+    hash_len=32,
+    salt_len=16
+)
+
+# Caché LRU de payloads JWT ya verificados. La clave mezcla el hash del token,
+# una época (se incrementa al revocar) y la ventana de 60 s vigente
+_TOKEN_CACHE_MAXSIZE = 4096
+_TOKEN_CACHE_WINDOW = 60
+_token_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+_token_cache_epoch = 0
+
+# Resultado completo de la autenticación por token (firma + versión en Redis),
+# válido como máximo 30 s o hasta que expire el token: (expira_en, TokenUser).
+# La caché es por proceso: revoke_all_tokens la vacía en el worker que atiende
+# la revocación, pero los demás workers pueden seguir aceptando un token
+# revocado durante, como mucho, _AUTH_CACHE_TTL segundos
+_AUTH_CACHE_TTL = 30
+_auth_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+# Fila de usuario de get_current_user_db por user_id, con el mismo TTL: (expira_en, user)
+_user_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+# Argumentos de jwt.decode precalculados: algoritmo fijo y claims obligatorios
+_DECODE_KWARGS = {
+    "algorithms": [settings.ALGORITHM],
+    "options": {"require": ["exp", "sub"]}
+}
+
+
+def invalidate_token_cache() -> None:
+    """Invalidar todos los payloads JWT y usuarios autenticados cacheados en este proceso"""
+    global _token_cache_epoch
+    _token_cache_epoch += 1
+    _token_cache.clear()
+    _auth_cache.clear()
+    _user_cache.clear()
+
+
+async def revoke_all_tokens(db, user_id: str) -> None:
+    """
+    Incrementar tokenVersion del usuario y publicarla en Redis
+    
+    Los access tokens con una versión anterior dejan de ser válidos de inmediato.
+    Usar en todo cambio que deba cortar el acceso: logout global, cambio o
+    reset de contraseña y desactivación de la cuenta.
+    """
+    user = await db.user.update(
+        where={"id": user_id},
+        data={"tokenVersion": {"increment": 1}}
+    )
+    if user:
+        await cache_service.set(
+            TokenManager.token_version_key(user_id), user.tokenVersion, ttl=86400
+        )
+    invalidate_token_cache()
+
+
+async def _current_token_version(user_id: str) -> Optional[int]:
+    """
+    Obtener la tokenVersion vigente del usuario
+    
+    Se lee de Redis; si la clave no existe (expirada, desalojada o Redis
+    vaciado) se consulta la BD y se vuelve a publicar, de modo que un fallo
+    de caché nunca acepta un token revocado. Devuelve None si el usuario no existe.
+    """
+    key = TokenManager.token_version_key(user_id)
+    current_version = await cache_service.get(key)
+    if current_version is not None:
+        return int(current_version)
+    
+    db = await get_db()
+    user = await db.user.find_unique(where={"id": user_id})
+    if not user:
+        return None
+    await cache_service.set(key, user.tokenVersion, ttl=86400)
+    return user.tokenVersion
+
+
+def _decode_token_cached(token: str) -> dict:
+    """Decodificar un JWT reutilizando la verificación criptográfica reciente"""
+    key = (
+        blake2b(token.encode(), digest_size=16).digest(),
+        _token_cache_epoch,
+        int(time.time() // _TOKEN_CACHE_WINDOW)
+    )
+    payload = _token_cache.get(key)
+    if payload is not None:
+        # La caché se salta el control de exp de PyJWT: no servir tokens caducados
+        if payload["exp"] > time.time():
+            _token_cache.move_to_end(key)
+            return payload
+        del _token_cache[key]
+    
+    payload = jwt.decode(token, settings.SECRET_KEY, **_DECODE_KWARGS)
+    _token_cache[key] = payload
+    if len(_token_cache) > _TOKEN_CACHE_MAXSIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
+
+# Formato básico de email, compilado una sola vez
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# Hash de referencia para usuarios inexistentes: el login verifica contra él
+# para que "usuario no existe" y "contraseña incorrecta" tarden lo mismo
+DUMMY_HASH = password_hasher.hash("dummy")
+
+# Pool dedicado al hashing: trabajo de CPU fuera del event loop, acotado a los
+# núcleos disponibles para no competir con el pool de I/O por defecto
+password_executor = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 1,
+    thread_name_prefix="password-hash"
+)
 
 # Configuración de JWT
 security = HTTPBearer()
 
 
 class PasswordManager:
-    """Gestor de contraseñas con bcrypt"""
+    """Gestor de contraseñas con Argon2id (acepta hashes bcrypt heredados)"""
     
     @staticmethod
     def hash_password(password: str) -> str:
-        """Hash de contraseña usando bcrypt"""
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return hashed.decode('utf-8')
+        """Hash de contraseña usando Argon2id"""
+        return password_hasher.hash(password)
     
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         """Verificar contraseña contra hash"""
         try:
-            return bcrypt.checkpw(
-                plain_password.encode('utf-8'), 
-                hashed_password.encode('utf-8')
-            )
-        except (ValueError, TypeError):
+            # Hashes bcrypt creados antes de migrar a Argon2id
+            if hashed_password.startswith("$2"):
+                return bcrypt.checkpw(
+                    plain_password.encode('utf-8'), 
+                    hashed_password.encode('utf-8')
+                )
+            return password_hasher.verify(hashed_password, plain_password)
+        except (VerificationError, InvalidHashError, ValueError, TypeError):
             return False
     
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        """Hash de contraseña en el pool dedicado sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            password_executor, PasswordManager.hash_password, password
+        )
+    
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """Verificar contraseña en el pool dedicado sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            password_executor, PasswordManager.verify_password, plain_password, hashed_password
+        )
+    
+    @staticmethod
+    def needs_rehash(hashed_password: str) -> bool:
+        """Indica si el hash debe regenerarse con los parámetros actuales"""
+        if not hashed_password.startswith("$argon2"):
+            return True
+        return password_hasher.check_needs_rehash(hashed_password)
+    
     @staticmethod
     def generate_random_password(length: int = 12) -> str:
         """Generar contraseña aleatoria segura"""
@@ -120,7 +272,7 @@ class TokenManager:
         return encoded_jwt
     
     @staticmethod
-    def create_refresh_token(user_id: str) -> str:
+    def create_refresh_token(user_id: str, token_version: Optional[int] = None) -> str:
         """Crear token de refresh"""
         expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
         
@@ -128,9 +280,15 @@ class TokenManager:
             "sub": user_id,
             "exp": expire,
             "type": "refresh",
-            "iat": datetime.utcnow()
+            "iat": datetime.utcnow(),
+            "jti": secrets.token_hex(16)  # Identificador para el registro de sesiones en Redis
         }
         
+        # Versión de tokens vigente al emitirlo: revocar la versión revoca también
+        # todos los refresh tokens, así que sigue siendo válida mientras él lo sea
+        if token_version is not None:
+            to_encode["ver"] = token_version
+        
         encoded_jwt = jwt.encode(
             to_encode, 
             settings.SECRET_KEY, 
@@ -146,11 +304,7 @@ class TokenManager:
         Retorna payload si es válido, lanza excepción si no
         """
         try:
-            payload = jwt.decode(
-                token, 
-                settings.SECRET_KEY, 
-                algorithms=[settings.ALGORITHM]
-            )
+            payload = dict(_decode_token_cached(token))
             
             # Verificar tipo de token
             if payload.get("type") != token_type:
@@ -159,9 +313,10 @@ class TokenManager:
                     detail=f"Token inválido: tipo esperado {token_type}"
                 )
             
-            # Verificar expiración
+            # Verificar expiración (exp es un timestamp Unix: comparar en epoch,
+            # no con datetimes locales frente a UTC)
             exp = payload.get("exp")
-            if exp and datetime.fromtimestamp(exp) < datetime.utcnow():
+            if exp and exp <= time.time():
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Token expirado"
@@ -169,12 +324,17 @@ class TokenManager:
             
             return payload
             
-        except JWTError as e:
+        except jwt.PyJWTError as e:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail=f"Token inválido: {str(e)}"
             )
     
+    @staticmethod
+    def token_version_key(user_id: str) -> str:
+        """Clave Redis con la versión vigente de tokens del usuario"""
+        return f"auth:ver:{user_id}"
+    
     @staticmethod
     def get_user_id_from_token(token: str) -> str:
         """Extraer user_id del token"""
@@ -221,9 +381,7 @@ class SecurityValidator:
     @staticmethod
     def validate_email(email: str) -> bool:
         """Validar formato de email básico"""
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
+        return _EMAIL_RE.match(email) is not None
     
     @staticmethod
     def sanitize_filename(filename: str) -> str:
@@ -279,18 +437,58 @@ class AuthorizationError(Exception):
     pass
 
 
+class TokenUser(NamedTuple):
+    """Usuario autenticado reconstruido a partir de los claims firmados del JWT"""
+    id: str
+    email: Optional[str] = None
+    token_version: Optional[int] = None
+
+
 # Funciones de utilidad para FastAPI dependencies
-def get_current_user_id(credentials: HTTPAuthorizationCredentials = None) -> str:
-    """Dependency para obtener user_id del token JWT"""
+async def _authenticate(credentials: HTTPAuthorizationCredentials) -> TokenUser:
+    """Verificar el token (firma, tipo y versión vigente) y devolver sus claims"""
     if not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token de autenticación requerido"
         )
     
+    token_key = blake2b(credentials.credentials.encode(), digest_size=16).digest()
+    cached = _auth_cache.get(token_key)
+    if cached is not None:
+        if cached[0] > time.time():
+            _auth_cache.move_to_end(token_key)
+            return cached[1]
+        del _auth_cache[token_key]
+    
     try:
-        user_id = TokenManager.get_user_id_from_token(credentials.credentials)
-        return user_id
+        payload = TokenManager.verify_token(credentials.credentials)
+        user_id = payload.get("sub")
+        
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token inválido: falta user_id"
+            )
+        
+        # Revocación global: el token debe tener la versión vigente del usuario
+        token_version = payload.get("ver")
+        if token_version is not None:
+            current_version = await _current_token_version(user_id)
+            if current_version != token_version:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token revocado"
+                )
+        
+        token_user = TokenUser(id=user_id, email=payload.get("email"), token_version=token_version)
+        
+        now = time.time()
+        _auth_cache[token_key] = (min(now + _AUTH_CACHE_TTL, payload.get("exp", now)), token_user)
+        if len(_auth_cache) > _TOKEN_CACHE_MAXSIZE:
+            _auth_cache.popitem(last=False)
+        
+        return token_user
     except HTTPException:
         raise
     except Exception as e:
@@ -300,9 +498,81 @@ def get_current_user_id(credentials: HTTPAuthorizationCredentials = None) -> str
         )
 
 
-def require_authentication(credentials: HTTPAuthorizationCredentials = security):
+async def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> str:
+    """Dependency para obtener user_id del token JWT"""
+    return (await _authenticate(credentials)).id
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> TokenUser:
+    """
+    Dependency para obtener el usuario autenticado sin consultar la BD
+    
+    El token está firmado y su versión se comprueba contra Redis, así que sus
+    claims (id, email) son fiables durante su vigencia. Las rutas que necesiten
+    la fila canónica (p. ej. escrituras) deben usar get_current_user_db.
+    """
+    return await _authenticate(credentials)
+
+
+async def get_current_user_db(user_id: str = Depends(get_current_user_id)):
+    """
+    Dependency para obtener el usuario autenticado completo desde la BD
+    
+    Comprueba además que la cuenta siga activa. FastAPI ya resuelve la
+    dependencia una vez por petición; además la fila se reutiliza entre
+    peticiones del mismo usuario durante _AUTH_CACHE_TTL segundos.
+    """
+    now = time.time()
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        if cached[0] > now:
+            _user_cache.move_to_end(user_id)
+            return cached[1]
+        del _user_cache[user_id]
+    
+    db = await get_db()
+    user = await db.user.find_unique(where={"id": user_id})
+    
+    if not user or not user.isActive:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuario no encontrado o inactivo"
+        )
+    
+    _user_cache[user_id] = (now + _AUTH_CACHE_TTL, user)
+    if len(_user_cache) > _TOKEN_CACHE_MAXSIZE:
+        _user_cache.popitem(last=False)
+    
+    return user
+
+
+# Roles con acceso a los endpoints de administración
+_ADMIN_ROLES = frozenset({UserRole.ADMIN, UserRole.SUPER_ADMIN})
+
+
+async def require_admin(current_user=Depends(get_current_user_db)):
+    """
+    Dependency que exige un usuario administrador
+    
+    Reutiliza la fila cacheada de get_current_user_db, así que las llamadas
+    seguidas de un mismo admin no consultan la BD durante _AUTH_CACHE_TTL segundos.
+    """
+    if current_user.role not in _ADMIN_ROLES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos para realizar esta acción"
+        )
+    
+    return current_user
+
+
+async def require_authentication(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Dependency que requiere autenticación válida"""
-    return get_current_user_id(credentials)
+    return await get_current_user_id(credentials)
 
 
 # Configuración de CORS para seguridad
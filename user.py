@@ -3,12 +3,21 @@ Esquemas de usuario para Synthia Style API
 Modelos para gestión de usuarios y preferencias
 """
 
+import re
 from typing import Optional, Dict, Any, List
 from datetime import datetime, date
 from enum import Enum
 
-from pydantic import BaseModel, Field, validator, EmailStr
-from .common import BaseConfig, TimestampMixin, MetadataMixin
+from pydantic import BaseModel, ConfigDict, Field, validator, EmailStr
+from .common import BASE_MODEL_CONFIG, TimestampMixin, MetadataMixin
+
+
+# Reglas de contraseña compiladas una sola vez (la longitud la valida Field)
+_PASSWORD_LETTER_RE = re.compile(r"[^\W\d_]")
+_PASSWORD_DIGIT_RE = re.compile(r"\d")
+
+# Dominios de email temporal rechazados en el registro
+_TEMP_DOMAINS = frozenset({'10minutemail.com', 'tempmail.org', 'guerrillamail.com'})
 
 
 class ProfileVisibility(str, Enum):
@@ -143,8 +152,7 @@ class UserBase(BaseModel):
             raise ValueError('Debe ser mayor de 13 años')
         return v
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 class UserCreate(UserBase):
@@ -156,23 +164,25 @@ class UserCreate(UserBase):
         description="Contraseña"
     )
     
+    @validator('email')
+    def reject_temporary_email(cls, v):
+        # Solo en el registro: las respuestas de usuarios existentes no se revalidan
+        if v.rpartition('@')[2] in _TEMP_DOMAINS:
+            raise ValueError('No se permiten emails temporales')
+        return v
+    
     @validator('password')
     def validate_password(cls, v):
-        if len(v) < 8:
-            raise ValueError('La contraseña debe tener al menos 8 caracteres')
-        
-        has_letter = any(c.isalpha() for c in v)
-        has_digit = any(c.isdigit() for c in v)
-        
-        if not has_letter:
+        if not _PASSWORD_LETTER_RE.search(v):
             raise ValueError('La contraseña debe contener al menos una letra')
-        if not has_digit:
+        if not _PASSWORD_DIGIT_RE.search(v):
             raise ValueError('La contraseña debe contener al menos un número')
         
         return v
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "email": "maria@example.com",
                 "password": "miContraseñaSegura123",
@@ -180,6 +190,7 @@ class UserCreate(UserBase):
                 "last_name": "García"
             }
         }
+    )
 
 
 class UserUpdate(BaseModel):
@@ -195,13 +206,15 @@ class UserUpdate(BaseModel):
         max_length=50
     )
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "first_name": "María Isabel",
                 "last_name": "García López"
             }
         }
+    )
 
 
 class UserResponse(UserBase, TimestampMixin):
@@ -209,8 +222,9 @@ class UserResponse(UserBase, TimestampMixin):
     id: str = Field(..., description="ID único del usuario")
     preferences: Optional["UserPreferences"] = None
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "id": "user_123456789",
                 "email": "maria@example.com",
@@ -221,9 +235,10 @@ class UserResponse(UserBase, TimestampMixin):
                 "updated_at": "2024-01-01T12:00:00Z"
             }
         }
+    )
 
 
-class UserPreferences(BaseModel, TimestampMixin):
+class UserPreferences(TimestampMixin):
     """Schema para preferencias de usuario"""
     id: str = Field(..., description="ID de las preferencias")
     user_id: str = Field(..., description="ID del usuario")
@@ -239,8 +254,9 @@ class UserPreferences(BaseModel, TimestampMixin):
         description="Visibilidad del perfil"
     )
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "id": "pref_123456789",
                 "user_id": "user_123456789",
@@ -250,6 +266,7 @@ class UserPreferences(BaseModel, TimestampMixin):
                 "profile_visibility": "private"
             }
         }
+    )
 
 
 class UserPreferencesUpdate(BaseModel):
@@ -259,8 +276,9 @@ class UserPreferencesUpdate(BaseModel):
     share_analytics: Optional[bool] = None
     profile_visibility: Optional[ProfileVisibility] = None
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "email_notifications": False,
                 "push_notifications": True,
@@ -268,6 +286,7 @@ class UserPreferencesUpdate(BaseModel):
                 "profile_visibility": "public"
             }
         }
+    )
 
 
 class UserStats(BaseModel):
@@ -278,8 +297,9 @@ class UserStats(BaseModel):
     favorite_recommendations: int = Field(default=0, description="Recomendaciones favoritas")
     feedback_count: int = Field(default=0, description="Cantidad de feedback dado")
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "total_facial_analyses": 3,
                 "total_chromatic_analyses": 2,
@@ -288,6 +308,7 @@ class UserStats(BaseModel):
                 "feedback_count": 2
             }
         }
+    )
 
 
 class UserProfile(UserResponse):
@@ -295,8 +316,9 @@ class UserProfile(UserResponse):
     preferences: Optional[UserPreferences] = None
     stats: Optional[UserStats] = None
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "id": "user_123456789",
                 "email": "maria@example.com",
@@ -318,6 +340,7 @@ class UserProfile(UserResponse):
                 }
             }
         }
+    )
 
 
 class UserSearch(BaseModel):
@@ -325,24 +348,27 @@ class UserSearch(BaseModel):
     query: str = Field(..., min_length=2, description="Término de búsqueda")
     include_inactive: bool = Field(default=False, description="Incluir usuarios inactivos")
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "query": "maria garcia",
                 "include_inactive": False
             }
         }
+    )
 
 
-class UserActivity(BaseModel, TimestampMixin):
+class UserActivity(TimestampMixin):
     """Schema para actividad de usuario"""
     user_id: str = Field(..., description="ID del usuario")
     activity_type: str = Field(..., description="Tipo de actividad")
     description: str = Field(..., description="Descripción de la actividad")
     metadata: Optional[Dict[str, Any]] = Field(None, description="Metadatos adicionales")
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "user_id": "user_123456789",
                 "activity_type": "facial_analysis",
@@ -354,6 +380,7 @@ class UserActivity(BaseModel, TimestampMixin):
                 "created_at": "2024-01-01T12:00:00Z"
             }
         }
+    )
 
 
 class UserDeletion(BaseModel):
@@ -368,14 +395,16 @@ class UserDeletion(BaseModel):
             raise ValueError('Debe confirmar la eliminación')
         return v
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "confirm_deletion": True,
                 "reason": "Ya no necesito el servicio",
                 "delete_all_data": True
             }
         }
+    )
 
 
 class UserExport(BaseModel):
@@ -383,10 +412,11 @@ class UserExport(BaseModel):
     include_analyses: bool = Field(default=True, description="Incluir análisis")
     include_recommendations: bool = Field(default=True, description="Incluir recomendaciones")
     include_feedback: bool = Field(default=True, description="Incluir feedback")
-    format: str = Field(default="json", regex="^(json|csv|pdf)$", description="Formato de exportación")
+    format: str = Field(default="json", pattern="^(json|csv|pdf)$", description="Formato de exportación")
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "include_analyses": True,
                 "include_recommendations": True,
@@ -394,9 +424,10 @@ class UserExport(BaseModel):
                 "format": "json"
             }
         }
+    )
 
 
-class UserInvitation(BaseModel, TimestampMixin):
+class UserInvitation(TimestampMixin):
     """Schema para invitación de usuario"""
     email: EmailStr = Field(..., description="Email del invitado")
     invited_by: str = Field(..., description="ID del usuario que invita")
@@ -404,8 +435,9 @@ class UserInvitation(BaseModel, TimestampMixin):
     expires_at: datetime = Field(..., description="Fecha de expiración")
     message: Optional[str] = Field(None, description="Mensaje personalizado")
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "email": "amiga@example.com",
                 "invited_by": "user_123456789",
@@ -414,9 +446,10 @@ class UserInvitation(BaseModel, TimestampMixin):
                 "message": "¡Te invito a probar Synthia Style!"
             }
         }
+    )
 
 
-class UserNotification(BaseModel, TimestampMixin):
+class UserNotification(TimestampMixin):
     """Schema para notificaciones de usuario"""
     user_id: str = Field(..., description="ID del usuario")
     title: str = Field(..., description="Título de la notificación")
@@ -425,8 +458,9 @@ class UserNotification(BaseModel, TimestampMixin):
     is_read: bool = Field(default=False, description="Notificación leída")
     action_url: Optional[str] = Field(None, description="URL de acción")
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "user_id": "user_123456789",
                 "title": "Nuevo análisis disponible",
@@ -436,11 +470,12 @@ class UserNotification(BaseModel, TimestampMixin):
                 "action_url": "/analysis/results/123"
             }
         }
+    )
 
 
 # ================ NUEVOS MODELOS PARA SISTEMA AVANZADO ================
 
-class UserProfileExtended(BaseModel, TimestampMixin):
+class UserProfileExtended(TimestampMixin):
     """Perfil extendido del usuario"""
     id: str = Field(..., description="ID del perfil")
     user_id: str = Field(..., description="ID del usuario")
@@ -472,8 +507,9 @@ class UserProfileExtended(BaseModel, TimestampMixin):
     show_stats_publicly: bool = Field(default=False)
     show_recommendations_publicly: bool = Field(default=False)
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "bio": "Apasionada por la moda y el estilo personal",
                 "profession": "Diseñadora Gráfica",
@@ -484,9 +520,10 @@ class UserProfileExtended(BaseModel, TimestampMixin):
                 "body_type": "hourglass"
             }
         }
+    )
 
 
-class UserPreferencesExtended(BaseModel, TimestampMixin):
+class UserPreferencesExtended(TimestampMixin):
     """Preferencias extendidas del usuario"""
     id: str = Field(..., description="ID de las preferencias")
     user_id: str = Field(..., description="ID del usuario")
@@ -509,18 +546,17 @@ class UserPreferencesExtended(BaseModel, TimestampMixin):
     auto_save_results: bool = Field(default=True)
     detailed_recommendations: bool = Field(default=True)
     include_confidence_score: bool = Field(default=True)
-    preferred_language: str = Field(default="es", regex="^(es|en|fr|de|it|pt)$")
+    preferred_language: str = Field(default="es", pattern="^(es|en|fr|de|it|pt)$")
     
     # Interfaz
     theme: Theme = Field(default=Theme.LIGHT)
-    currency: str = Field(default="USD", regex="^[A-Z]{3}$")
+    currency: str = Field(default="USD", pattern="^[A-Z]{3}$")
     timezone: str = Field(default="UTC")
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
-class UserAnalyticsData(BaseModel, TimestampMixin):
+class UserAnalyticsData(TimestampMixin):
     """Analytics del usuario"""
     id: str = Field(..., description="ID de analytics")
     user_id: str = Field(..., description="ID del usuario")
@@ -559,11 +595,10 @@ class UserAnalyticsData(BaseModel, TimestampMixin):
     # Timing
     last_calculated: datetime = Field(default_factory=datetime.utcnow)
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
-class UserOnboardingData(BaseModel, TimestampMixin):
+class UserOnboardingData(TimestampMixin):
     """Datos de onboarding del usuario"""
     id: str = Field(..., description="ID de onboarding")
     user_id: str = Field(..., description="ID del usuario")
@@ -583,7 +618,7 @@ class UserOnboardingData(BaseModel, TimestampMixin):
     # Personalización
     detected_preferences: Optional[Dict[str, Any]] = Field(None)
     initial_style_goals: List[str] = Field(default=[])
-    onboarding_path: str = Field(default="standard", regex="^(standard|quick|detailed)$")
+    onboarding_path: str = Field(default="standard", pattern="^(standard|quick|detailed)$")
     
     # Timing
     started_at: datetime = Field(default_factory=datetime.utcnow)
@@ -591,11 +626,10 @@ class UserOnboardingData(BaseModel, TimestampMixin):
     last_step_completed_at: Optional[datetime] = Field(None)
     time_to_complete: Optional[int] = Field(None, ge=0, description="Minutos para completar")
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
-class SubscriptionFeaturesData(BaseModel, TimestampMixin):
+class SubscriptionFeaturesData(TimestampMixin):
     """Features disponibles por tier de suscripción"""
     tier: SubscriptionTier = Field(..., description="Tier de suscripción")
     
@@ -638,8 +672,9 @@ class SubscriptionFeaturesData(BaseModel, TimestampMixin):
     # Estado
     is_active: bool = Field(default=True)
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "tier": "PREMIUM",
                 "monthly_analysis_limit": 25,
@@ -649,9 +684,10 @@ class SubscriptionFeaturesData(BaseModel, TimestampMixin):
                 "yearly_price": 99.99
             }
         }
+    )
 
 
-class DailyUsageData(BaseModel, TimestampMixin):
+class DailyUsageData(TimestampMixin):
     """Datos de uso diario del usuario"""
     id: str = Field(..., description="ID de uso diario")
     user_id: str = Field(..., description="ID del usuario")
@@ -671,11 +707,10 @@ class DailyUsageData(BaseModel, TimestampMixin):
     daily_limit_reached: bool = Field(default=False)
     limit_reached_at: Optional[datetime] = Field(None)
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
-class UserSubscriptionHistory(BaseModel, TimestampMixin):
+class UserSubscriptionHistory(TimestampMixin):
     """Historial de suscripciones del usuario"""
     id: str = Field(..., description="ID del historial")
     user_id: str = Field(..., description="ID del usuario")
@@ -696,8 +731,7 @@ class UserSubscriptionHistory(BaseModel, TimestampMixin):
     change_reason: Optional[str] = Field(None)
     previous_tier: Optional[SubscriptionTier] = Field(None)
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 class UserDashboard(BaseModel):
@@ -710,8 +744,7 @@ class UserDashboard(BaseModel):
     subscription_features: Optional[SubscriptionFeaturesData] = None
     recent_usage: Optional[DailyUsageData] = None
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 class UserExtended(UserBase, TimestampMixin):
@@ -737,8 +770,9 @@ class UserExtended(UserBase, TimestampMixin):
     # Estado
     is_verified: bool = Field(default=False)
     
-    class Config(BaseConfig):
-        schema_extra = {
+    model_config = ConfigDict(
+        **BASE_MODEL_CONFIG,
+        json_schema_extra={
             "example": {
                 "id": "user_123456789",
                 "email": "maria@example.com",
@@ -750,6 +784,7 @@ class UserExtended(UserBase, TimestampMixin):
                 "is_verified": True
             }
         }
+    )
 
 
 # Esquemas de actualización
@@ -772,14 +807,11 @@ class UserProfileUpdate(BaseModel):
     show_stats_publicly: Optional[bool] = Field(None)
     show_recommendations_publicly: Optional[bool] = Field(None)
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
-class UserAdvancedUpdate(BaseModel):
-    """Schema para actualización avanzada de usuario"""
-    first_name: Optional[str] = Field(None, min_length=1, max_length=50)
-    last_name: Optional[str] = Field(None, min_length=1, max_length=50)
+class UserAdvancedUpdate(UserUpdate):
+    """Schema para actualización avanzada de usuario (nombres heredados de UserUpdate)"""
     date_of_birth: Optional[date] = Field(None)
     gender: Optional[Gender] = Field(None)
     location: Optional[str] = Field(None, max_length=100)
@@ -787,8 +819,7 @@ class UserAdvancedUpdate(BaseModel):
     hair_color: Optional[HairColor] = Field(None)
     eye_color: Optional[EyeColor] = Field(None)
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 # Esquemas de respuesta para onboarding
@@ -800,8 +831,7 @@ class OnboardingStepResponse(BaseModel):
     is_completed: bool = Field(..., description="Si está completado")
     fields_required: List[str] = Field(default=[], description="Campos requeridos")
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 class OnboardingFlowResponse(BaseModel):
@@ -812,8 +842,7 @@ class OnboardingFlowResponse(BaseModel):
     steps: List[OnboardingStepResponse] = Field(..., description="Lista de pasos")
     recommended_path: str = Field(..., description="Ruta recomendada")
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 # Esquemas para sistema de suscripciones
@@ -821,10 +850,9 @@ class SubscriptionUpgrade(BaseModel):
     """Schema para upgrade de suscripción"""
     target_tier: SubscriptionTier = Field(..., description="Tier objetivo")
     payment_method: str = Field(..., description="Método de pago")
-    billing_cycle: str = Field(default="monthly", regex="^(monthly|yearly)$")
+    billing_cycle: str = Field(default="monthly", pattern="^(monthly|yearly)$")
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 class UsageLimitsResponse(BaseModel):
@@ -837,8 +865,7 @@ class UsageLimitsResponse(BaseModel):
     can_analyze: bool = Field(..., description="Si puede hacer más análisis")
     time_until_reset: Optional[int] = Field(None, description="Minutos hasta reset diario")
     
-    class Config(BaseConfig):
-        pass
+    model_config = BASE_MODEL_CONFIG
 
 
 # Actualizar forward references
@@ -15,10 +15,32 @@ from app.schemas.user import (
     SubscriptionTier, UserRole, SubscriptionFeaturesData,
     UserAnalyticsData, UserOnboardingData, OnboardingFlowResponse,
     OnboardingStepResponse, UsageLimitsResponse, DailyUsageData,
-    ChurnRisk
+    ChurnRisk, UserPreferences
 )
 
 
+def preferences_schema(preferences) -> Optional[UserPreferences]:
+    """
+    Convertir la fila Prisma de preferencias (camelCase) al schema de respuesta
+    
+    Compartido por las rutas que devuelven UserResponse/UserProfile sin
+    revalidar, para que todas expongan las mismas claves snake_case.
+    """
+    if preferences is None:
+        return None
+    
+    return UserPreferences.model_construct(
+        id=preferences.id,
+        user_id=preferences.userId,
+        email_notifications=preferences.emailNotifications,
+        push_notifications=preferences.pushNotifications,
+        share_analytics=preferences.shareAnalytics,
+        profile_visibility=preferences.profileVisibility,
+        created_at=preferences.createdAt,
+        updated_at=preferences.updatedAt
+    )
+
+
 class UserAnalyticsService:
     """Servicio para manejo de analytics de usuario"""
     
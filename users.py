@@ -17,11 +17,12 @@ from app.schemas.user import (
     OnboardingStepResponse, SubscriptionTier, UserRole
 )
 from app.schemas.common import APIResponse, PaginationParams, PaginatedResponse
-from app.core.security import get_current_user_id
+from app.core.security import get_current_user_id, revoke_all_tokens
 from app.db.database import get_db
+from app.services.cache_service import cache_service
 from app.services.user_service import (
     user_service, user_analytics_service, user_onboarding_service,
-    subscription_service
+    subscription_service, preferences_schema
 )
 
 router = APIRouter()
@@ -29,7 +30,9 @@ router = APIRouter()
 
 # ============= ENDPOINTS DE PERFIL BÁSICO =============
 
-@router.get("/profile", response_model=UserProfile)
+# Los perfiles se construyen con model_construct a partir de filas de la BD
+# (ya tipadas); el modelo queda solo como documentación en OpenAPI
+@router.get("/profile", response_model=None, responses={200: {"model": UserProfile}})
 async def get_user_profile(
     current_user_id: str = Depends(get_current_user_id),
     db=Depends(get_db)
@@ -67,13 +70,13 @@ async def get_user_profile(
         last_analysis_date = last_analysis.createdAt if last_analysis else None
         
         from app.schemas.user import UserStats
-        stats = UserStats(
+        stats = UserStats.model_construct(
             total_facial_analyses=facial_analyses_count,
             total_chromatic_analyses=chromatic_analyses_count,
             last_analysis_date=last_analysis_date
         )
         
-        return UserProfile(
+        return UserProfile.model_construct(
             id=user.id,
             email=user.email,
             first_name=user.firstName,
@@ -81,7 +84,7 @@ async def get_user_profile(
             is_active=user.isActive,
             created_at=user.createdAt,
             updated_at=user.updatedAt,
-            preferences=user.preferences,
+            preferences=preferences_schema(user.preferences),
             stats=stats
         )
         
@@ -247,7 +250,7 @@ async def update_extended_profile(
         )
 
 
-@router.put("/profile", response_model=UserResponse)
+@router.put("/profile", response_model=None, responses={200: {"model": UserResponse}})
 async def update_user_profile(
     user_update: UserUpdate,
     current_user_id: str = Depends(get_current_user_id),
@@ -277,7 +280,7 @@ async def update_user_profile(
             include={"preferences": True}
         )
         
-        return UserResponse(
+        return UserResponse.model_construct(
             id=updated_user.id,
             email=updated_user.email,
             first_name=updated_user.firstName,
@@ -285,7 +288,7 @@ async def update_user_profile(
             is_active=updated_user.isActive,
             created_at=updated_user.createdAt,
             updated_at=updated_user.updatedAt,
-            preferences=updated_user.preferences
+            preferences=preferences_schema(updated_user.preferences)
         )
         
     except HTTPException:
@@ -861,6 +864,15 @@ async def delete_user_profile(
             data={"isActive": False}
         )
         
+        # Las sesiones replican el estado del usuario para el refresh
+        await db.usersession.update_many(
+            where={"userId": current_user_id},
+            data={"isActive": False}
+        )
+        await cache_service.revoke_user_refresh_tokens(current_user_id)
+        # Cortar también los access tokens: las rutas de lectura confían en sus claims
+        await revoke_all_tokens(db, current_user_id)
+        
         return APIResponse(message="Perfil eliminado exitosamente")
         
     except HTTPException:
@@ -892,6 +904,9 @@ async def delete_user_account(
             where={"userId": current_user_id},
             data={"isActive": False}
         )
+        await cache_service.revoke_user_refresh_tokens(current_user_id)
+        # Cortar también los access tokens: las rutas de lectura confían en sus claims
+        await revoke_all_tokens(db, current_user_id)
         
         return APIResponse(message="Cuenta desactivada exitosamente")
         
@@ -4,8 +4,9 @@ Endpoints para la gestión de items del armario virtual
 
 import logging
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Response
 from fastapi.security import HTTPBearer
+from pydantic import TypeAdapter
 
 from app.schemas.wardrobe import (
     WardrobeItemCreate, WardrobeItemUpdate, WardrobeItemResponse,
@@ -13,7 +14,7 @@ from app.schemas.wardrobe import (
     WardrobeStats
 )
 from app.services.wardrobe_service import WardrobeService
-from app.core.security import get_current_user
+from app.core.security import TokenUser, get_current_user, get_current_user_db
 from app.models.user import User
 
 logger = logging.getLogger(__name__)
@@ -24,12 +25,26 @@ router = APIRouter(prefix="/wardrobe", tags=["wardrobe"])
 # Inicializar servicio
 wardrobe_service = WardrobeService()
 
-@router.post("/items", response_model=WardrobeItemResponse)
+# Serializador de listas de items: el servicio ya devuelve modelos validados, así
+# que se vuelcan a JSON directamente sin el jsonable_encoder/revalidación de FastAPI
+_ITEM_LIST_ADAPTER = TypeAdapter(List[WardrobeItemResponse])
+
+
+def _item_response(item: WardrobeItemResponse) -> Response:
+    """Serializar un item ya validado sin pasar por response_model"""
+    return Response(content=item.model_dump_json(), media_type="application/json")
+
+
+@router.post(
+    "/items",
+    response_model=None,
+    responses={200: {"model": WardrobeItemResponse}}
+)
 async def create_wardrobe_item(
     item_data: WardrobeItemCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_user_db),
     images: List[UploadFile] = File(default=[])
-):
+) -> Response:
     """
     Crear un nuevo item en el armario virtual
     
@@ -60,15 +75,19 @@ async def create_wardrobe_item(
             image_files=images if images else None
         )
         
-        return result
+        return _item_response(result)
         
     except Exception as e:
         logger.error(f"Error creating wardrobe item: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/items", response_model=List[WardrobeItemResponse])
+@router.get(
+    "/items",
+    response_model=None,
+    responses={200: {"model": List[WardrobeItemResponse]}}
+)
 async def get_wardrobe_items(
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_user),
     category: Optional[ClothingCategory] = Query(None, description="Filtrar por categoría"),
     style: Optional[ClothingStyle] = Query(None, description="Filtrar por estilo"),
     season: Optional[Season] = Query(None, description="Filtrar por temporada"),
@@ -77,7 +96,7 @@ async def get_wardrobe_items(
     is_favorite: Optional[bool] = Query(None, description="Filtrar por favoritos"),
     limit: int = Query(100, ge=1, le=500, description="Límite de resultados"),
     offset: int = Query(0, ge=0, description="Offset para paginación")
-):
+) -> Response:
     """
     Obtener items del armario con filtros opcionales
     
@@ -96,17 +115,24 @@ async def get_wardrobe_items(
             offset=offset
         )
         
-        return items
+        return Response(
+            content=_ITEM_LIST_ADAPTER.dump_json(items),
+            media_type="application/json"
+        )
         
     except Exception as e:
         logger.error(f"Error getting wardrobe items: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/items/{item_id}", response_model=WardrobeItemResponse)
+@router.get(
+    "/items/{item_id}",
+    response_model=None,
+    responses={200: {"model": WardrobeItemResponse}}
+)
 async def get_wardrobe_item(
     item_id: str,
-    current_user: User = Depends(get_current_user)
-):
+    current_user: TokenUser = Depends(get_current_user)
+) -> Response:
     """
     Obtener un item específico del armario
     
@@ -121,7 +147,7 @@ async def get_wardrobe_item(
         if not item:
             raise HTTPException(status_code=404, detail="Item no encontrado")
         
-        return item
+        return _item_response(item)
         
     except HTTPException:
         raise
@@ -129,12 +155,16 @@ async def get_wardrobe_item(
         logger.error(f"Error getting wardrobe item: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.put("/items/{item_id}", response_model=WardrobeItemResponse)
+@router.put(
+    "/items/{item_id}",
+    response_model=None,
+    responses={200: {"model": WardrobeItemResponse}}
+)
 async def update_wardrobe_item(
     item_id: str,
     update_data: WardrobeItemUpdate,
-    current_user: User = Depends(get_current_user)
-):
+    current_user: User = Depends(get_current_user_db)
+) -> Response:
     """
     Actualizar un item del armario
     
@@ -151,7 +181,7 @@ async def update_wardrobe_item(
         if not updated_item:
             raise HTTPException(status_code=404, detail="Item no encontrado")
         
-        return updated_item
+        return _item_response(updated_item)
         
     except HTTPException:
         raise
@@ -162,7 +192,7 @@ async def update_wardrobe_item(
 @router.delete("/items/{item_id}")
 async def delete_wardrobe_item(
     item_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Eliminar un item del armario
@@ -189,7 +219,7 @@ async def delete_wardrobe_item(
 @router.post("/items/{item_id}/wear")
 async def record_item_wear(
     item_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Registrar que se usó un item (incrementar contador de uso)
@@ -215,7 +245,7 @@ async def record_item_wear(
 
 @router.get("/stats", response_model=WardrobeStats)
 async def get_wardrobe_stats(
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Obtener estadísticas completas del armario
@@ -245,7 +275,7 @@ async def get_clothing_categories():
 @router.post("/items/{item_id}/analyze")
 async def analyze_item_ai(
     item_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Re-analizar un item con IA para actualizar tags y análisis
@@ -298,7 +328,7 @@ async def analyze_item_ai(
 @router.get("/items/{item_id}/suggestions")
 async def get_item_combinations(
     item_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_user),
     occasion: Optional[Occasion] = Query(None, description="Ocasión específica"),
     max_suggestions: int = Query(5, ge=1, le=10, description="Máximo de sugerencias")
 ):
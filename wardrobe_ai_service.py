@@ -3,14 +3,17 @@ Servicio de IA para análisis de prendas y generación de outfits en Synthia Sty
 """
 
 import asyncio
-import json
 import logging
+from collections import defaultdict
+from operator import attrgetter
 from typing import List, Dict, Any, Optional, Tuple
 from decimal import Decimal
 import colorsys
 import re
 from datetime import datetime
 
+import orjson
+
 from app.services.gemini_service import GeminiService
 from app.schemas.wardrobe import (
     ClothingCategory, ClothingSubcategory, ClothingStyle, Season, Occasion,
@@ -19,6 +22,17 @@ from app.schemas.wardrobe import (
 
 logger = logging.getLogger(__name__)
 
+# Objeto JSON dentro del texto de Gemini, compilado una sola vez
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+_get_category = attrgetter("category")
+
+# Estilos (en minúsculas) usados para puntuar formalidad y tendencia
+_FORMAL_STYLES = frozenset({"formal", "business", "elegant", "classic"})
+_CASUAL_STYLES = frozenset({"casual", "sporty", "bohemian"})
+_TRENDY_STYLES = frozenset({"trendy", "edgy", "contemporary"})
+_CLASSIC_INDICATORS = ("classic", "timeless", "traditional", "elegant")
+
 class WardrobeAIService:
     """Servicio de IA para análisis de armario virtual"""
     
@@ -159,11 +173,10 @@ class WardrobeAIService:
         """Extraer JSON válido del texto de respuesta"""
         try:
             # Buscar JSON en el texto
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(text)
             if json_match:
-                json_str = json_match.group()
-                return json.loads(json_str)
-        except json.JSONDecodeError:
+                return orjson.loads(json_match.group())
+        except orjson.JSONDecodeError:
             pass
         return {}
 
@@ -231,11 +244,9 @@ class WardrobeAIService:
 
     def _calculate_formality(self, styles: List[str]) -> int:
         """Calcular nivel de formalidad (0-100)"""
-        formal_styles = ["formal", "business", "elegant", "classic"]
-        casual_styles = ["casual", "sporty", "bohemian"]
-        
-        formal_score = sum(1 for style in styles if style.lower() in formal_styles)
-        casual_score = sum(1 for style in styles if style.lower() in casual_styles)
+        lowered = [style.lower() for style in styles]
+        formal_score = sum(1 for style in lowered if style in _FORMAL_STYLES)
+        casual_score = sum(1 for style in lowered if style in _CASUAL_STYLES)
         
         if formal_score > casual_score:
             return min(100, 60 + (formal_score * 15))
@@ -246,18 +257,16 @@ class WardrobeAIService:
 
     def _calculate_trend_factor(self, styles: List[str]) -> int:
         """Calcular factor de tendencia (0-100)"""
-        trendy_styles = ["trendy", "edgy", "contemporary"]
-        classic_styles = ["classic", "vintage", "traditional"]
-        
-        trendy_score = sum(1 for style in styles if style.lower() in trendy_styles)
-        classic_score = sum(1 for style in styles if style.lower() in classic_styles)
+        trendy_score = sum(1 for style in styles if style.lower() in _TRENDY_STYLES)
         
         return min(100, (trendy_score * 30) + 20)
 
     def _calculate_classic_score(self, styles: List[str]) -> int:
         """Calcular puntuación clásica (0-100)"""
-        classic_indicators = ["classic", "timeless", "traditional", "elegant"]
-        return min(100, sum(20 for style in styles if any(indicator in style.lower() for indicator in classic_indicators)))
+        return min(100, sum(
+            20 for style in styles
+            if any(indicator in style.lower() for indicator in _CLASSIC_INDICATORS)
+        ))
 
     def _calculate_color_harmony(self, colors: List[str]) -> Dict[str, Any]:
         """Calcular armonía de colores"""
@@ -413,12 +422,9 @@ class WardrobeAIService:
         """Generar combinaciones válidas de outfits"""
         
         # Agrupar items por categoría
-        items_by_category = {}
+        items_by_category = defaultdict(list)
         for item in items:
-            category = item.category
-            if category not in items_by_category:
-                items_by_category[category] = []
-            items_by_category[category].append(item)
+            items_by_category[_get_category(item)].append(item)
         
         # Items obligatorios
         must_include_items = []
@@ -13,7 +13,7 @@ from app.schemas.wardrobe import (
     StylePreferencesUpdate, StylePreferencesResponse
 )
 from app.services.wardrobe_service import WardrobeService
-from app.core.security import get_current_user
+from app.core.security import TokenUser, get_current_user, get_current_user_db
 from app.models.user import User
 
 logger = logging.getLogger(__name__)
@@ -27,7 +27,7 @@ wardrobe_service = WardrobeService()
 @router.post("/analyze", response_model=WardrobeAnalysisResponse)
 async def analyze_wardrobe(
     analysis_type: WardrobeAnalysisType = Query(..., description="Tipo de análisis a realizar"),
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Realizar análisis completo del armario
@@ -54,7 +54,7 @@ async def analyze_wardrobe(
 
 @router.get("/analysis/history", response_model=List[WardrobeAnalysisResponse])
 async def get_analysis_history(
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_user),
     analysis_type: WardrobeAnalysisType = Query(None, description="Filtrar por tipo de análisis"),
     limit: int = Query(10, ge=1, le=50, description="Límite de resultados")
 ):
@@ -75,7 +75,7 @@ async def get_analysis_history(
 
 @router.get("/recommendations/shopping", response_model=List[ShoppingRecommendationResponse])
 async def get_shopping_recommendations(
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_user),
     limit: int = Query(20, ge=1, le=100, description="Límite de recomendaciones"),
     priority_min: float = Query(0, ge=0, le=10, description="Prioridad mínima"),
     budget_max: float = Query(None, ge=0, description="Presupuesto máximo")
@@ -112,7 +112,7 @@ async def get_shopping_recommendations(
 async def update_recommendation_action(
     recommendation_id: str,
     action: str = Query(..., regex="^(viewed|clicked|purchased|rejected)$"),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Actualizar acción realizada en una recomendación
@@ -136,7 +136,7 @@ async def update_recommendation_action(
 
 @router.get("/preferences/style", response_model=StylePreferencesResponse)
 async def get_style_preferences(
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Obtener preferencias de estilo del usuario
@@ -178,7 +178,7 @@ async def get_style_preferences(
 @router.post("/preferences/style", response_model=StylePreferencesResponse)
 async def create_style_preferences(
     preferences: StylePreferencesCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Crear o actualizar preferencias de estilo del usuario
@@ -208,7 +208,7 @@ async def create_style_preferences(
 @router.put("/preferences/style", response_model=StylePreferencesResponse)
 async def update_style_preferences(
     preferences: StylePreferencesUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_db)
 ):
     """
     Actualizar preferencias de estilo existentes
@@ -246,7 +246,7 @@ async def update_style_preferences(
 
 @router.get("/insights/color-palette")
 async def get_color_palette_insights(
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Obtener insights sobre la paleta de colores del armario
@@ -308,7 +308,7 @@ async def get_color_palette_insights(
 
 @router.get("/insights/versatility")
 async def get_versatility_insights(
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Obtener insights sobre la versatilidad del armario
@@ -391,7 +391,7 @@ async def get_versatility_insights(
 
 @router.get("/insights/cost-efficiency")
 async def get_cost_efficiency_insights(
-    current_user: User = Depends(get_current_user)
+    current_user: TokenUser = Depends(get_current_user)
 ):
     """
     Obtener insights sobre la eficiencia de costos del armario
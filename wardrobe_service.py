@@ -11,6 +11,7 @@ from decimal import Decimal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete, update, and_, or_
 from sqlalchemy.orm import selectinload
+from pydantic import TypeAdapter
 
 from app.db.database import get_database
 from app.models.user import User
@@ -21,6 +22,11 @@ from app.services.cache_service import CacheService
 
 logger = logging.getLogger(__name__)
 
+# Validación de listas de items en una sola llamada al núcleo de Pydantic (en vez
+# de un __init__ por fila). No se usa model_construct: las filas SQL traen las
+# categorías/estilos como texto y el servicio de IA necesita los miembros del enum
+_ITEM_LIST_ADAPTER = TypeAdapter(List[WardrobeItemResponse])
+
 class WardrobeService:
     """Servicio principal para el armario virtual"""
     
@@ -131,7 +137,7 @@ class WardrobeService:
             cached_result = await self.cache_service.get(cache_key)
             
             if cached_result:
-                return [WardrobeItemResponse(**item) for item in cached_result]
+                return _ITEM_LIST_ADAPTER.validate_python(cached_result)
             
             async with get_database() as db:
                 # Construir query con filtros
@@ -147,7 +153,9 @@ class WardrobeService:
                     params["style"] = style.value
                 
                 if season:
-                    query += " AND :season = ANY(season)"
+                    # Solapamiento de arrays (usa el índice GIN): la temporada pedida
+                    # o prendas de toda temporada, como en el filtro del servicio de IA
+                    query += " AND season && ARRAY[:season, 'ALL_SEASON']::\"Season\"[]"
                     params["season"] = season.value
                 
                 if occasion:
@@ -155,8 +163,14 @@ class WardrobeService:
                     params["occasion"] = occasion.value
                 
                 if color:
-                    query += " AND (LOWER(color) LIKE :color OR :color = ANY(ARRAY(SELECT LOWER(unnest(secondary_colors)))))"
-                    params["color"] = f"%{color.lower()}%"
+                    # ILIKE sobre la columna tal cual (no LOWER(color)) para que pueda
+                    # usar el índice GIN de trigramas; los colores secundarios se
+                    # comparan con el mismo patrón
+                    query += (
+                        " AND (color ILIKE :color"
+                        " OR EXISTS (SELECT 1 FROM unnest(secondary_colors) AS c WHERE c ILIKE :color))"
+                    )
+                    params["color"] = f"%{color}%"
                 
                 if is_favorite is not None:
                     query += " AND is_favorite = :is_favorite"
@@ -170,12 +184,14 @@ class WardrobeService:
                 items = result.fetchall()
                 
                 # Convertir a response schemas
-                response_items = [WardrobeItemResponse(**dict(item)) for item in items]
+                response_items = _ITEM_LIST_ADAPTER.validate_python(
+                    [dict(item) for item in items]
+                )
                 
                 # Cachear resultado
                 await self.cache_service.set(
                     cache_key,
-                    [item.dict() for item in response_items],
+                    _ITEM_LIST_ADAPTER.dump_python(response_items, mode="json"),
                     expire=300  # 5 minutos
                 )
                 
@@ -217,13 +233,8 @@ class WardrobeService:
         
         try:
             async with get_database() as db:
-                # Verificar que el item pertenezca al usuario
-                existing_item = await self.get_wardrobe_item(user_id, item_id)
-                if not existing_item:
-                    return None
-                
                 # Preparar datos de actualización
-                update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
+                update_dict = update_data.model_dump(exclude_none=True)
                 update_dict["updated_at"] = datetime.now()
                 
                 # Convertir enums a strings
@@ -237,13 +248,12 @@ class WardrobeService:
                     set_clauses.append(f"{key} = :{key}")
                     params[key] = value
                 
-                if not set_clauses:
-                    return existing_item
-                
+                # La propiedad del item se comprueba en el propio WHERE: sin
+                # SELECT previo, un solo viaje a la BD; sin filas => no existe
                 query = f"""
                 UPDATE wardrobe_items 
                 SET {', '.join(set_clauses)}
-                WHERE id = :item_id AND user_id = :user_id
+                WHERE id = :item_id AND user_id = :user_id AND is_active = true
                 RETURNING *
                 """
                 
@@ -276,10 +286,13 @@ class WardrobeService:
                 
                 result = await db.execute(query, {"item_id": item_id, "user_id": user_id})
                 
+                if result.rowcount == 0:
+                    return False
+                
                 # Limpiar caché
                 await self._invalidate_user_wardrobe_cache(user_id)
                 
-                return result.rowcount > 0
+                return True
                 
         except Exception as e:
             logger.error(f"Error deleting wardrobe item: {str(e)}")
@@ -330,7 +343,7 @@ class WardrobeService:
             wardrobe_items = await self.get_wardrobe_items(user_id, limit=1000)
             
             if not wardrobe_items:
-                return OutfitGenerationResponse(
+                return OutfitGenerationResponse.model_construct(
                     suggestions=[],
                     analysis={"message": "No hay suficientes items en el armario"},
                     alternatives=["Agrega más prendas a tu armario"],
@@ -357,7 +370,9 @@ class WardrobeService:
             # Generar alternativas
             alternatives = self._generate_alternatives(suggestions, request)
             
-            response = OutfitGenerationResponse(
+            # Las sugerencias ya son OutfitSuggestion validadas por el servicio de IA
+            # y el resto son datos construidos aquí: no hace falta revalidar
+            response = OutfitGenerationResponse.model_construct(
                 suggestions=suggestions,
                 analysis={
                     "total_items_analyzed": len(wardrobe_items),
@@ -373,7 +388,7 @@ class WardrobeService:
             
         except Exception as e:
             logger.error(f"Error generating outfit suggestions: {str(e)}")
-            return OutfitGenerationResponse(
+            return OutfitGenerationResponse.model_construct(
                 suggestions=[],
                 analysis={"error": str(e)},
                 alternatives=[],